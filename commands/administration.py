@@ -16,7 +16,7 @@ from discord.ext import commands, pages
 from discord.commands import Option, SlashCommandGroup
 from discord.ui import InputText
 
-from __main__ import log, db
+from __main__ import log, db, guild_settings
 from commands.errorhandler import CheckOwner
 from formatting.embed import gen_embed
 from formatting.constants import COLORS, UNITS
@@ -691,8 +691,8 @@ class Administration(commands.Cog):
 
                     if view.value:
                         log.info('Workflow confirm')
-                        await db.servers.update_one({"server_id": interaction.guild_id},
-                                                    {"$set": {'prefix': new_prefix.clean_content}})
+                        await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                        {"$set": {'prefix': new_prefix.clean_content}})
                         interaction.message.embeds[0].description = f'**Prefix: {new_prefix_content}**'
                         self.value = new_prefix_content
                         await interaction.message.edit(embed=interaction.message.embeds[0])
@@ -733,13 +733,13 @@ class Administration(commands.Cog):
                 await interaction.response.defer()
                 doc = await db.servers.find_one({"server_id": interaction.guild_id})
                 if doc['announcements']:
-                    await db.servers.update_one({"server_id": interaction.guild_id},
-                                                {"$set": {'announcements': False}})
+                    await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                    {"$set": {'announcements': False}})
                     interaction.message.embeds[0].description = 'Disabled'
                     self.value = 'Disabled'
                 else:
-                    await db.servers.update_one({"server_id": interaction.guild_id},
-                                                {"$set": {'announcements': True}})
+                    await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                    {"$set": {'announcements': True}})
                     interaction.message.embeds[0].description = 'Enabled'
                     self.value = 'Enabled'
 
@@ -819,8 +819,8 @@ class Administration(commands.Cog):
 
                     if view.value:
                         log.info('Workflow confirm')
-                        await db.servers.update_one({"server_id": interaction.guild_id},
-                                                    {"$set": {'announcement_channel': new_announcement_channel.id}})
+                        await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                        {"$set": {'announcement_channel': new_announcement_channel.id}})
 
                         doc = await db.servers.find_one({"server_id": interaction.guild_id})
                         if doc['announcements']:
@@ -945,9 +945,9 @@ class Administration(commands.Cog):
                                          "\nThis is likely an error on Discord's end. Please try again later.")),
                                 ephemeral=True)
                             return
-                    await db.servers.update_one({"server_id": interaction.guild_id},
-                                                {"$set": {'modmail_channel': None,
-                                                          'modmail_button_channel': None}})
+                    await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                    {"$set": {'modmail_channel': None,
+                                                              'modmail_button_channel': None}})
                     interaction.message.embeds[0].description = '**Disabled**'
                     self.value = 'Disabled'
                     self.children[1].disabled = True
@@ -1006,9 +1006,9 @@ class Administration(commands.Cog):
                             return
 
                     if setup_phase1_success and setup_phase2_success:
-                        await db.servers.update_one({"server_id": interaction.guild_id},
-                                                    {"$set": {'modmail_channel': new_destination_channel.id,
-                                                              'modmail_button_channel': new_button_channel.id}})
+                        await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                        {"$set": {'modmail_channel': new_destination_channel.id,
+                                                                  'modmail_button_channel': new_button_channel.id}})
                         new_description = (f'**Enabled** \n Destination channel: {new_destination_channel.mention}'
                                            f'\n Button channel: {new_button_channel.mention}')
                         interaction.message.embeds[0].description = new_description
@@ -1046,8 +1046,8 @@ class Administration(commands.Cog):
 
                     if view.value:
                         log.info('Workflow confirm')
-                        await db.servers.update_one({"server_id": interaction.guild_id},
-                                                    {"$set": {'modmail_channel': new_destination_channel.id}})
+                        await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                        {"$set": {'modmail_channel': new_destination_channel.id}})
                         doc = await db.servers.find_one({"server_id": interaction.guild_id})
                         modmail_button_channel = interaction.guild.get_channel(int(doc['modmail_button_channel']))
                         interaction.message.embeds[0].description = ('**Enabled** \nDestination channel:'
@@ -1084,8 +1084,8 @@ class Administration(commands.Cog):
 
                     if view.value:
                         log.info('Workflow confirm')
-                        await db.servers.update_one({"server_id": interaction.guild_id},
-                                                    {"$set": {'modmail_button_channel': new_button_channel.id}})
+                        await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                        {"$set": {'modmail_button_channel': new_button_channel.id}})
                         doc = await db.servers.find_one({"server_id": interaction.guild_id})
                         m_modmail_channel = interaction.guild.get_channel(int(doc['modmail_channel']))
                         interaction.message.embeds[0].description = ('**Enabled** \nDestination channel:'
@@ -1130,13 +1130,13 @@ class Administration(commands.Cog):
                 await interaction.response.defer()
                 doc = await db.servers.find_one({"server_id": interaction.guild_id})
                 if doc['chat']:
-                    await db.servers.update_one({"server_id": interaction.guild_id},
-                                                {"$set": {'chat': False}})
+                    await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                    {"$set": {'chat': False}})
                     interaction.message.embeds[0].description = 'Disabled'
                     self.value = 'Disabled'
                 else:
-                    await db.servers.update_one({"server_id": interaction.guild_id},
-                                                {"$set": {'chat': True}})
+                    await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                    {"$set": {'chat': True}})
                     interaction.message.embeds[0].description = 'Enabled'
                     self.value = 'Enabled'
 
@@ -1215,14 +1215,14 @@ class Administration(commands.Cog):
                 await interaction.response.defer()
                 doc = await db.servers.find_one({"server_id": interaction.guild_id})
                 if doc['blacklist']:
-                    await db.servers.update_one({"server_id": interaction.guild_id},
-                                                {"$set": {'blacklist': None}})
+                    await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                    {"$set": {'blacklist': None}})
                     interaction.message.embeds[0].description = 'Disabled'
                     self.value = 'Disabled'
                     await interaction.message.edit(embed=interaction.message.embeds[0])
                 elif doc['whitelist']:
-                    await db.servers.update_one({"server_id": interaction.guild_id},
-                                                {"$set": {'whitelist': None}})
+                    await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                    {"$set": {'whitelist': None}})
                     interaction.message.embeds[0].description = 'Disabled'
                     self.value = 'Disabled'
                     await interaction.message.edit(embed=interaction.message.embeds[0])
@@ -1232,13 +1232,13 @@ class Administration(commands.Cog):
                     await select_view.wait()
 
                     if select_view.value == 'Blacklist':
-                        await db.servers.update_one({"server_id": interaction.guild_id},
-                                                    {"$set": {'blacklist': []}})
+                        await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                        {"$set": {'blacklist': []}})
                         interaction.message.embeds[0].description = 'Blacklist enabled. No active channels.'
                         self.value = 'Blacklist enabled for the following channels: '
                     if select_view.value == 'Whitelist':
-                        await db.servers.update_one({"server_id": interaction.guild_id},
-                                                    {"$set": {'whitelist': []}})
+                        await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                        {"$set": {'whitelist': []}})
                         interaction.message.embeds[0].description = 'Whitelist enabled. No active channels.'
                         self.value = 'Whitelist enabled for the following channels: '
 
@@ -1281,13 +1281,13 @@ class Administration(commands.Cog):
                 await interaction.response.defer()
                 doc = await db.servers.find_one({"server_id": interaction.guild_id})
                 if doc['chat']:
-                    await db.servers.update_one({"server_id": interaction.guild_id},
-                                                {"$set": {'fun': False}})
+                    await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                    {"$set": {'fun': False}})
                     interaction.message.embeds[0].description = 'Disabled'
                     self.value = 'Disabled'
                 else:
-                    await db.servers.update_one({"server_id": interaction.guild_id},
-                                                {"$set": {'fun': True}})
+                    await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                    {"$set": {'fun': True}})
                     interaction.message.embeds[0].description = 'Enabled'
                     self.value = 'Enabled'
 
@@ -1441,8 +1441,8 @@ class Administration(commands.Cog):
                             case 'Strikes':
                                 post['log_strikes'][0] = True
 
-                    await db.servers.update_one({"server_id": interaction.guild_id},
-                                                {"$set": post})
+                    await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                    {"$set": post})
 
                 if self.defaults["log_messages"][1]:
                     log_message_channel = interaction.guild.get_channel(int(self.defaults["log_messages"][1]))
@@ -1585,8 +1585,8 @@ class Administration(commands.Cog):
                             case 'Strikes':
                                 self.defaults['log_strikes'][1] = new_log_channel.id
 
-                        await db.servers.update_one({"server_id": interaction.guild_id},
-                                                    {"$set": self.defaults})
+                        await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                        {"$set": self.defaults})
 
                         if self.defaults["log_messages"][1]:
                             log_message_channel = interaction.guild.get_channel(int(self.defaults["log_messages"][1]))
@@ -1659,8 +1659,8 @@ class Administration(commands.Cog):
                                style=discord.ButtonStyle.danger,
                                row=0)
             async def disable_autorole(self, button: discord.ui.Button, interaction: discord.Interaction):
-                await db.servers.update_one({"server_id": interaction.guild_id},
-                                            {"$set": {'autorole': None}})
+                await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                {"$set": {'autorole': None}})
                 interaction.message.embeds[0].description = 'Disabled'
                 self.value = 'Disabled'
                 await interaction.message.edit(embed=interaction.message.embeds[0])
@@ -1729,8 +1729,8 @@ class Administration(commands.Cog):
 
                     if view.value:
                         log.info('Workflow confirm')
-                        await db.servers.update_one({"server_id": interaction.guild_id},
-                                                    {"$set": {'autorole': new_role.id}})
+                        await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                        {"$set": {'autorole': new_role.id}})
                         interaction.message.embeds[0].description = f'Enabled for role {new_role.mention}'
                         self.value = f'Enabled for role {new_role.mention}'
                         await interaction.message.edit(embed=interaction.message.embeds[0])
@@ -1768,8 +1768,8 @@ class Administration(commands.Cog):
                                style=discord.ButtonStyle.danger,
                                row=0)
             async def disable_modrole(self, button: discord.ui.Button, interaction: discord.Interaction):
-                await db.servers.update_one({"server_id": interaction.guild_id},
-                                            {"$set": {'modrole': None}})
+                await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                {"$set": {'modrole': None}})
                 interaction.message.embeds[0].description = 'Disabled'
                 self.value = 'Disabled'
                 await interaction.message.edit(embed=interaction.message.embeds[0])
@@ -1838,8 +1838,8 @@ class Administration(commands.Cog):
 
                     if view.value:
                         log.info('Workflow confirm')
-                        await db.servers.update_one({"server_id": interaction.guild_id},
-                                                    {"$set": {'modrole': new_role.id}})
+                        await guild_settings.update_one({"server_id": interaction.guild_id},
+                                                        {"$set": {'modrole': new_role.id}})
                         interaction.message.embeds[0].description = f'Enabled for role {new_role.mention}'
                         self.value = f'Enabled for role {new_role.mention}'
                         await interaction.message.edit(embed=interaction.message.embeds[0])
@@ -2021,8 +2021,8 @@ class Administration(commands.Cog):
             blacklist = document['blacklist']
             if channel.id not in blacklist:
                 blacklist.append(channel.id)
-                await db.servers.update_one({"server_id": ctx.guild_id},
-                                            {"$set": {'blacklist': blacklist}})
+                await guild_settings.update_one({"server_id": ctx.guild_id},
+                                                {"$set": {'blacklist': blacklist}})
                 await ctx.interaction.followup.send(embed=
                                                     gen_embed(title='Add Channel to Blacklist',
                                                               content=f'Channel {channel.mention} has been added '
@@ -2052,8 +2052,8 @@ class Administration(commands.Cog):
             blacklist = document['blacklist']
             if channel.id in blacklist:
                 blacklist.remove(channel.id)
-                await db.servers.update_one({"server_id": ctx.guild_id},
-                                            {"$set": {'blacklist': blacklist}})
+                await guild_settings.update_one({"server_id": ctx.guild_id},
+                                                {"$set": {'blacklist': blacklist}})
                 await ctx.interaction.followup.send(embed=
                                                     gen_embed(title='Remove Channel from Blacklist',
                                                               content=f'Channel {channel.mention} has been removed '
@@ -2085,8 +2085,8 @@ class Administration(commands.Cog):
             whitelist = document['whitelist']
             if channel.id not in whitelist:
                 whitelist.append(channel.id)
-                await db.servers.update_one({"server_id": ctx.guild_id},
-                                            {"$set": {'whitelist': whitelist}})
+                await guild_settings.update_one({"server_id": ctx.guild_id},
+                                                {"$set": {'whitelist': whitelist}})
                 await ctx.interaction.followup.send(embed=
                                                     gen_embed(title='Add channel to Whitelist',
                                                               content=f'Channel {channel.mention} has been added '
@@ -2116,8 +2116,8 @@ class Administration(commands.Cog):
             whitelist = document['whitelist']
             if channel.id in whitelist:
                 whitelist.remove(channel.id)
-                await db.servers.update_one({"server_id": ctx.guild_id},
-                                            {"$set": {'whitelist': whitelist}})
+                await guild_settings.update_one({"server_id": ctx.guild_id},
+                                                {"$set": {'whitelist': whitelist}})
                 await ctx.interaction.followup.send(embed=
                                                     gen_embed(title='Remove Channel from Whitelist',
                                                               content=f'Channel {channel.mention} has been removed '
@@ -3105,10 +3105,9 @@ class Administration(commands.Cog):
                         log_channel = ctx.guild.get_channel(int(document['log_strikes'][1]))
                         await log_channel.send(embed=embed)
 
-                    valid_strikes = []  # potentially redundant but added as a safe measure
                     searchtime = datetime.datetime.now(datetime.timezone.utc) + relativedelta(seconds=10)
-                    results = await check_strike(ctx, user, current_time=searchtime, valid_strikes=valid_strikes)
-                    log.info(results)  # debug
+                    summary = await strike_summary(ctx.interaction.guild_id, user.id, current_time=searchtime)
+                    results = summary['active_strikes']
 
                     # Ban check should always come before timeout check
                     if len(results) >= document['max_strike']:
@@ -3389,21 +3388,15 @@ class Administration(commands.Cog):
 
         await ctx.interaction.response.defer()
 
-        valid_strikes = []  # probably redundant but doing it anyways to prevent anything stupid
-        results = await check_strike(ctx,
-                                     user,
-                                     current_time=datetime.datetime.now(datetime.timezone.utc) + relativedelta(
-                                         minutes=2),
-                                     valid_strikes=valid_strikes)
-        results = sorted(results, key=lambda d: d['time'])
-        num_strikes = len(results)
+        summary = await strike_summary(ctx.guild.id,
+                                       user.id,
+                                       current_time=datetime.datetime.now(datetime.timezone.utc) + relativedelta(
+                                           minutes=2))
+        results = sorted(summary['active_strikes'], key=lambda d: d['time'])
+        num_strikes = summary['active']
 
         strike_pages = []
 
-        expired_query = {'server_id': ctx.guild.id, 'user_id': user.id}
-        expired_results = db.warns.find(expired_query).sort('time', pymongo.DESCENDING)
-        expired_strikes = []
-
         active_member = ctx.guild.get_member(user.id)
         if active_member:
             member_duration = abs(active_member.joined_at - datetime.datetime.now(datetime.timezone.utc))
@@ -3418,27 +3411,25 @@ class Administration(commands.Cog):
             base_embed = gen_embed(name=f'{user.name}#{user.discriminator}', icon_url=user.display_avatar.url,
                                    title='User Lookup', content=f'This user is no longer in the server.')
 
-        async for document in expired_results:
-            if document not in results:
-                expired_strikes.append(document)
-                document_id = str(document['_id'])
-                stime = document['time']
-                reason = document['reason']
-                message_link = document['message_link']
-                moderator = document['moderator']
-                embed_field = (f'Strike UID: {document_id} | Moderator: {moderator}\nReason: {reason}'
-                               f'\n[Go to message/evidence]({message_link})')
-                if len(embed_field) > 1024:
-                    truncate = len(reason) - (len(embed_field) - 1024) - 4
-                    reason = reason[0:truncate] + "..."
-                strike_embed = base_embed.copy()
-                strike_embed.add_field(name=f'Strike (EXPIRED)| {stime.ctime()}',
-                                       value=(f'Strike UID: {document_id} | Moderator: {moderator}\nReason: {reason}'
-                                              f'\n[Go to message/evidence]({message_link})'),
-                                       inline=False)
-                strike_embed.set_footer(text=f'UID: {user.id}')
-                strike_pages.append(strike_embed)
-        num_expired = len(expired_strikes)
+        for document in summary['expired_strikes']:
+            document_id = str(document['_id'])
+            stime = document['time']
+            reason = document['reason']
+            message_link = document['message_link']
+            moderator = document['moderator']
+            embed_field = (f'Strike UID: {document_id} | Moderator: {moderator}\nReason: {reason}'
+                           f'\n[Go to message/evidence]({message_link})')
+            if len(embed_field) > 1024:
+                truncate = len(reason) - (len(embed_field) - 1024) - 4
+                reason = reason[0:truncate] + "..."
+            strike_embed = base_embed.copy()
+            strike_embed.add_field(name=f'Strike (EXPIRED)| {stime.ctime()}',
+                                   value=(f'Strike UID: {document_id} | Moderator: {moderator}\nReason: {reason}'
+                                          f'\n[Go to message/evidence]({message_link})'),
+                                   inline=False)
+            strike_embed.set_footer(text=f'UID: {user.id}')
+            strike_pages.append(strike_embed)
+        num_expired = summary['expired']
 
         base_embed.add_field(name='Strikes',
                              value=(f'Found {num_strikes + num_expired} strikes for this user.\n'
@@ -3603,43 +3594,89 @@ class Administration(commands.Cog):
 #   3. Two strikes active (past 2-4 months, timer reset due to accumulation of second strike)
 #   4. Two strikes active (past 2 months)
 #   5. Three strikes active (proceed to ban the user)
-async def check_strike(ctx, member, current_time=datetime.datetime.now(datetime.timezone.utc), valid_strikes=None):
-    log.info(current_time)  # this is here for debugging race condition atm
-
-    # Create the search query
-    expire_date = current_time + relativedelta(months=-2)
-    query = {'server_id': ctx.guild.id, 'user_id': member.id, 'time': {'$gte': expire_date, '$lt': current_time}}
-    results = await db.warns.count_documents(query)
-
-    if results > 0:
-        # This case means we have an active strike.
-        # Let's check the next strike to see if it's within 2 months of this strike.
-        # This sorts our query by date and will return the latest strike
-        log.info('found strike, beginning search process')
-        results = db.warns.find(query).sort('time', pymongo.DESCENDING).limit(1)
-        document = await results.to_list(length=None)
-        document = document.pop()
-        valid_strikes.append(document)
-
-        if len(valid_strikes) >= 3:
-            # Ban time boom boom. stop searching and step out
-            log.info('max_strike exceeded, proceed to ban')
-            results = db.warns.find(query).sort('time', pymongo.DESCENDING)
-            document = await results.to_list(length=None)
-            document.pop(0)
-            for strike in document:
-                valid_strikes.append(strike)
-            return valid_strikes
-
-        # Else it's time to step in and start the recursion to check the next two months again.
-        # If the second strike is found, we will step in one final time to check for the third and final strike.
-        newtime = document['time']
-        return await check_strike(ctx, member, current_time=newtime, valid_strikes=valid_strikes)
-
-    else:
-        # This means we didn't get a hit, so let's step out and spit out our list.
-        log.info('all strike cases false')
-        return valid_strikes
+async def strike_summary(guild_id, user_id, current_time=None):
+    """Loads every strike for the user in one query on the (server_id, user_id, time) index and splits them into
+    active and expired strikes following the scenarios above. Returns a dict with the active, expired and total counts
+    along with the matching strike documents, newest first. Callers that only need the counts should use
+    strike_counts instead.
+    """
+    if current_time is None:
+        current_time = datetime.datetime.now(datetime.timezone.utc)
+    strikes = await db.warns.find({'server_id': guild_id, 'user_id': user_id}) \
+        .sort('time', pymongo.DESCENDING).to_list(length=None)
+
+    # pymongo hands back naive UTC datetimes
+    def strike_time(strike):
+        return strike['time'].replace(tzinfo=datetime.timezone.utc) if strike['time'].tzinfo is None \
+            else strike['time']
+
+    # Starting from now, take the latest strike in the past 2 months, then look 2 months back from that strike for
+    # the next one. Once the max is reached, everything else in the current window counts as well.
+    active_strikes = []
+    window_end = current_time
+    while True:
+        window = [strike for strike in strikes
+                  if window_end + relativedelta(months=-2) <= strike_time(strike) < window_end]
+        if not window:
+            break
+        active_strikes.append(window[0])
+        if len(active_strikes) >= 3:
+            active_strikes.extend(window[1:])
+            break
+        window_end = strike_time(window[0])
+
+    expired_strikes = [strike for strike in strikes if strike not in active_strikes]
+    return {'active': len(active_strikes),
+            'expired': len(expired_strikes),
+            'total': len(strikes),
+            'active_strikes': active_strikes,
+            'expired_strikes': expired_strikes}
+
+
+def _two_months_before(date):
+    return {'$dateSubtract': {'startDate': date, 'unit': 'month', 'amount': 2}}
+
+
+def _strike_chain(times, current_time):
+    """$reduce expression applying the strike_summary chain rule to an array of strike times sorted newest first.
+    State: we/lo bound the current 2 month window, capped means the max was reached so only the rest of that window
+    still counts, stopped means an empty window was found.
+    """
+    def merge(**fields):
+        return {'$mergeObjects': ['$$value', fields]}
+
+    active = {'$add': ['$$value.active', 1]}
+    return {'$reduce': {
+        'input': times,
+        'initialValue': {'we': current_time, 'lo': _two_months_before(current_time), 'active': 0,
+                         'capped': False, 'stopped': False},
+        'in': {'$cond': ['$$value.stopped', '$$value', {'$cond': [
+            # Strikes at or after the window end belong to no window
+            {'$gte': ['$$this', '$$value.we']}, '$$value', {'$cond': [
+                {'$lt': ['$$this', '$$value.lo']}, merge(stopped=True), {'$cond': [
+                    {'$or': ['$$value.capped', {'$gte': [active, 3]}]},
+                    merge(active=active, capped=True),
+                    merge(active=active, we='$$this', lo=_two_months_before('$$this'))]}]}]}]}
+    }}
+
+
+async def strike_counts(guild_id, user_ids, current_time=None):
+    """Batched, count-only form of strike_summary. One aggregation on the (server_id, user_id, time) index computes
+    the active, expired and total counts server side, so no strike documents are loaded. Returns a dict of
+    user_id -> counts, users without strikes are left out.
+    """
+    if current_time is None:
+        current_time = datetime.datetime.now(datetime.timezone.utc)
+    pipeline = [{'$match': {'server_id': guild_id, 'user_id': {'$in': list(user_ids)}}},
+                {'$sort': {'user_id': pymongo.ASCENDING, 'time': pymongo.DESCENDING}},
+                {'$group': {'_id': '$user_id', 'times': {'$push': '$time'}, 'total': {'$sum': 1}}},
+                {'$project': {'total': 1, 'active': _strike_chain('$times', current_time)}},
+                {'$project': {'total': 1, 'active': '$active.active'}}]
+    results = await db.warns.aggregate(pipeline)
+    results = await results.to_list(length=None)
+    return {result['_id']: {'active': result['active'],
+                            'expired': result['total'] - result['active'],
+                            'total': result['total']} for result in results}
 
 
 def setup(bot):
@@ -1,3 +1,4 @@
+import bisect
 import json
 import os
 import time
@@ -6,13 +7,11 @@ import datetime
 
 import numpy as np
 import plotly.graph_objects as go
-from sklearn.linear_model import LinearRegression
 
 from datetime import timezone, timedelta
 from tabulate import tabulate
 
-from httpx import AsyncClient, HTTPStatusError
-from httpx_caching import CachingClient
+from httpx import HTTPStatusError
 
 import discord
 from discord import File
@@ -21,7 +20,7 @@ from discord.commands import Option, OptionChoice, SlashCommandGroup
 from discord import default_permissions
 
 from formatting.embed import gen_embed
-from __main__ import log, db
+from __main__ import log, db, bestdori, event_timeline
 
 
 # adds commas to a number to make it easier to read
@@ -72,11 +71,138 @@ def check_valid_server_tier(server, tier):
         return False
 
 
+class CutoffEstimator:
+    """Least squares fit of ep against event progress for a tier's tracker history.
+
+    The fit is kept as running sums (n, Σx, Σy, Σxy, Σx²) along with the smoothing weight totals, so new tracker
+    points are folded in without refitting everything that came before them.
+    """
+
+    STATE_FIELDS = ('n', 'sum_x', 'sum_y', 'sum_xy', 'sum_xx', 'total_weight', 'total_time', 'last_point',
+                    'last_time')
+
+    def __init__(self, event_start: int, event_end: int, event_rate: float):
+        self.event_start = event_start
+        self.event_end = event_end
+        self.event_duration = event_end - event_start
+        self.thp_check = event_start + 43200000  # twelve hours since event start check
+        self.tfhp_check = self.thp_check + 43200000  # twenty-four hours since event start check
+        self.end_freeze_check = event_end - 86400000  # freeze calc twenty-four hours before event end
+        self.event_rate = event_rate
+        self.n = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+        self.sum_xx = 0.0
+        self.total_weight = 0.0
+        self.total_time = 0.0
+        self.last_point = None
+        self.last_time = 0
+
+    @classmethod
+    def from_state(cls, state, event_start: int, event_end: int, event_rate: float):
+        """Rebuild an estimator from a stored state, or start a fresh one if the event or rate changed since."""
+        estimator = cls(event_start, event_end, event_rate)
+        if state and (state['event_start'], state['event_end'], state['event_rate']) == (event_start, event_end,
+                                                                                          event_rate):
+            for field in cls.STATE_FIELDS:
+                setattr(estimator, field, state[field])
+        return estimator
+
+    def state(self):
+        state = {field: getattr(self, field) for field in self.STATE_FIELDS}
+        state.update(event_start=self.event_start, event_end=self.event_end, event_rate=self.event_rate)
+        return state
+
+    def fit(self):
+        denominator = self.n * self.sum_xx - self.sum_x ** 2
+        if not self.n or not denominator:
+            return 0.0, (self.sum_y / self.n if self.n else 0.0)
+        slope = (self.n * self.sum_xy - self.sum_x * self.sum_y) / denominator
+        return slope, (self.sum_y - slope * self.sum_x) / self.n
+
+    def _emit(self, points, percent_into_event, slope, intercept):
+        estimate = (intercept + slope + (self.event_rate * slope))
+        weights = [estimate * percent_into_event ** 2, percent_into_event ** 2]
+        self.total_weight += weights[0]
+        self.total_time += weights[1]
+        self.last_point = {
+            'estimate': estimate,
+            'slope': slope,
+            'intercept': intercept,
+            'weights': weights,
+            'time': percent_into_event
+        }
+        points.append(self.last_point)
+
+    def add(self, entry_time, ep):
+        return self.extend([entry_time], [ep])
+
+    def extend(self, entry_times, eps):
+        """Fold tracker points (in time order) into the fit and return the estimate data points they produce.
+
+        The fits after every point are computed at once from cumulative sums, seeded with the current running sums.
+        """
+        entry_times = np.asarray(entry_times, dtype=np.int64)
+        if not len(entry_times):
+            return []
+        eps = np.asarray(eps, dtype=np.float64)
+        percents = (entry_times - self.event_start) / self.event_duration
+        qualified = (self.thp_check <= entry_times) & (entry_times <= self.end_freeze_check)
+        x = np.where(qualified, percents, 0.0)
+        y = np.where(qualified, eps, 0.0)
+
+        def running(start, values):
+            # Summed sequentially from the stored total so batches give the same floats as one long history
+            return np.cumsum(np.concatenate(([start], values)))[1:]
+
+        n = self.n + np.cumsum(qualified)
+        sum_x = running(self.sum_x, x)
+        sum_y = running(self.sum_y, y)
+        sum_xy = running(self.sum_xy, x * y)
+        sum_xx = running(self.sum_xx, x * x)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x ** 2)
+            slopes = np.where(np.isfinite(slopes), slopes, 0.0)
+            intercepts = (sum_y - slopes * sum_x) / n
+
+        points = []
+        for entry_time, percent_into_event, count, slope, intercept in zip(entry_times.tolist(), percents.tolist(),
+                                                                           n.tolist(), slopes.tolist(),
+                                                                           intercepts.tolist()):
+            if self.tfhp_check <= entry_time <= self.end_freeze_check and count >= 5:
+                self._emit(points, percent_into_event, slope, intercept)
+            if entry_time >= self.end_freeze_check:
+                # Calculate last estimate using a different weight
+                if self.last_point:
+                    slope, intercept = self.last_point['slope'], self.last_point['intercept']
+                else:
+                    slope, intercept = 0, 0  # not sure if this is good assumption
+                self._emit(points, percent_into_event, slope, intercept)
+
+        self.n = int(n[-1])
+        self.sum_x = float(sum_x[-1])
+        self.sum_y = float(sum_y[-1])
+        self.sum_xy = float(sum_xy[-1])
+        self.sum_xx = float(sum_xx[-1])
+        self.last_time = int(entry_times[-1])
+        return points
+
+    @property
+    def non_smoothed_estimate(self):
+        return int(self.last_point['estimate']) if self.last_point else 0
+
+    @property
+    def smoothed_estimate(self):
+        if not self.last_point or not self.total_time:
+            return 0
+        return math.floor(self.total_weight / self.total_time)
+
+
 class Event(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.client = AsyncClient(follow_redirects=True)
-        self.client = CachingClient(self.client)
+        self.client = bestdori
 
         with open("config.json") as file:
             config_json = json.load(file)
@@ -88,40 +214,22 @@ class Event(commands.Cog):
                                         2, jp_event_id - 3, jp_event_id - 4, jp_event_id - 5]
 
     async def fetch_api(self, url):
-        api = await self.client.get(url)
-        log.info(f'{url} returned ' + str(api.status_code))
         try:
-            parsed = api.json()
+            parsed = await self.client.get_json(url)
         except json.decoder.JSONDecodeError:
             return None
         return parsed
 
     async def get_current_event_id(self, server: int):
-        current_time = time.time() * 1000
-        current_event_id = ''
-        api = await self.fetch_api('https://bestdori.com/api/events/all.5.json')
-        for event in api:
-            if api[event]['startAt'][server]:
-                if float(api[event]['startAt'][server]) < current_time < float(api[event]['endAt'][server]):
-                    current_event_id = event
-                    break
-        if not current_event_id:
-            try:
-                for event in api:
-                    try:
-                        if current_time < float(api[event]['startAt'][server]):
-                            current_event_id = int(event) - 1
-                            break
-                    except TypeError:
-                        # For between events, show previous event
-                        current_event_id = int(event) - 1
-                        break
-            except KeyError:
-                current_event_id = list(api.keys())[-1]
-        if current_event_id:
-            return current_event_id
-        else:
-            return 0
+        await event_timeline.wait_ready()
+        event = event_timeline.current(server)
+        if event:
+            return event.event_id
+        # For between events, show previous event
+        event = event_timeline.previous(server)
+        if event:
+            return int(event.event_id)
+        return 0
 
     async def get_event_name(self, server: int, eventid: int):
         api = await self.fetch_api(f'https://bestdori.com/api/events/{eventid}.json')
@@ -460,7 +568,7 @@ class Event(commands.Cog):
         image_file = File(saved_file, filename=file_name)
         return file_name, image_file
 
-    async def calc_cutoff(self, server: int, event_id: int, tier: int):
+    async def calc_cutoff(self, server: int, event_id: int, tier: int, stored_cutoff: dict = None):
         event_api = await self.fetch_api(f'https://bestdori.com/api/events/{event_id}.json')
         cutoff_api = await self.fetch_api(
             f'https://bestdori.com/api/tracker/data?server={server}&event={event_id}&tier={tier}')
@@ -469,10 +577,6 @@ class Event(commands.Cog):
         event_type = event_api['eventType']
         event_start = int(event_api['startAt'][server])
         event_end = int(event_api['endAt'][server])
-        event_duration = event_end - event_start
-        thp_check = event_start + 43200000  # twelve hours since event start check
-        tfhp_check = thp_check + 43200000  # twenty-four hours since event start check
-        end_freeze_check = event_end - 86400000  # freeze calc twenty-four hours before event end
 
         event_rate = None
         for rate in rates_api:
@@ -482,75 +586,22 @@ class Event(commands.Cog):
             event_rate = .01
 
         last_retrieved_cutoff = cutoff_api['cutoffs'][-1]['ep']
-        all_time_data = []
-        all_ep_data = []
-        qualified_time_data = []
-        qualified_ep_data = []
-        estimate_data = []
-
-        for entry in cutoff_api['cutoffs']:
-            entry_time = int(entry['time'])
-            time_difference = entry_time - event_start
-            percent_into_event = time_difference / event_duration
-
-            all_time_data.append(percent_into_event * 100)
-            all_ep_data.append(entry['ep'])
-
-            if thp_check <= entry_time <= end_freeze_check:
-                qualified_time_data.append(percent_into_event)
-                qualified_ep_data.append(entry['ep'])
-            if tfhp_check <= entry_time <= end_freeze_check and len(qualified_ep_data) >= 5:
-                x = np.array(qualified_time_data).reshape((-1, 1))
-                y = np.array(qualified_ep_data)
-                model = LinearRegression().fit(x, y)
-                slope, intercept = model.coef_[0], model.intercept_
-                estimate = (intercept + slope + (event_rate * slope))
-                weights = [estimate * percent_into_event ** 2, percent_into_event ** 2]
-                data_point = {
-                    'estimate': estimate,
-                    'slope': slope,
-                    'intercept': intercept,
-                    'weights': weights,
-                    'time': percent_into_event
-                }
-                estimate_data.append(data_point)
-            if entry_time >= end_freeze_check:
-                # Calculate last estimate using a different weight
-                try:
-                    variables = estimate_data[-1]
-                    intercept = variables['intercept']
-                    slope = variables['slope']
-                    estimate = (intercept + slope + (event_rate * slope))
-                except IndexError:
-                    estimate = 0
-                    intercept = 0  # not sure if this is good assumption
-                    slope = 0
-
-                weights = [estimate * percent_into_event ** 2, percent_into_event ** 2]
-                data_point = {
-                    'estimate': estimate,
-                    'slope': slope,
-                    'intercept': intercept,
-                    'weights': weights,
-                    'time': percent_into_event
-                }
-                estimate_data.append(data_point)
-
-        total_weight = 0
-        total_time = 0
-        for entry in estimate_data:
-            total_weight += entry['weights'][0]
-            total_time += entry['weights'][1]
-
-        if estimate_data:
-            non_smoothed_estimate = int(estimate_data[-1]['estimate'])
-            try:
-                smoothed_estimate = math.floor(total_weight / total_time)
-            except ZeroDivisionError:
-                smoothed_estimate = 0
+        entry_times = [int(entry['time']) for entry in cutoff_api['cutoffs']]
+        all_ep_data = [entry['ep'] for entry in cutoff_api['cutoffs']]
+        all_time_data = ((np.array(entry_times) - event_start) / (event_end - event_start) * 100).tolist()
+
+        # Pick up from the stored model if there is one, so only tracker points newer than it are processed
+        stored_cutoff = stored_cutoff or {}
+        estimator = CutoffEstimator.from_state(stored_cutoff.get('cutoff_model'), event_start, event_end, event_rate)
+        rebuilt = estimator.last_time == 0
+        first_new = bisect.bisect_right(entry_times, estimator.last_time)
+        new_estimate_data = estimator.extend(entry_times[first_new:], all_ep_data[first_new:])
+        if rebuilt:
+            estimate_data = new_estimate_data
         else:
-            non_smoothed_estimate = 0
-            smoothed_estimate = 0
+            estimate_data = stored_cutoff.get('estimate_data', []) + new_estimate_data
+        non_smoothed_estimate = estimator.non_smoothed_estimate
+        smoothed_estimate = estimator.smoothed_estimate
 
         last_updated_time = cutoff_api['cutoffs'][-1]['time']
         elapsed_hours = (last_updated_time - event_start) / 1000 / 3600
@@ -563,6 +614,9 @@ class Event(commands.Cog):
             'estimate_data': estimate_data,
             'all_time_data': all_time_data,
             'all_ep_data': all_ep_data,
+            'new_estimate_data': new_estimate_data,
+            'rebuilt': rebuilt,
+            'cutoff_model': estimator.state()
         }
         return cutoff_estimate
 
@@ -663,7 +717,7 @@ class Event(commands.Cog):
                             graph_info.append(file_name)
                             graph_info.append(graph_file)
                         else:
-                            estimate = await self.calc_cutoff(server, event_id, tier)
+                            estimate = await self.calc_cutoff(server, event_id, tier, latest_stored_cutoff)
                             graph_info = await self.create_graph(server, event_id, tier,
                                                                  estimate['all_ep_data'],
                                                                  estimate['all_time_data'],
@@ -671,7 +725,7 @@ class Event(commands.Cog):
                 else:
                     # Data is not the same, udpate DB and calculate values
                     cutoff_difference = latest_retrieved_cutoff - cutoff
-                    estimate = await self.calc_cutoff(server, event_id, tier)
+                    estimate = await self.calc_cutoff(server, event_id, tier, latest_stored_cutoff)
                     entry = {
                         'current_ep': latest_retrieved_cutoff,
                         'smoothed_estimate': estimate['smoothed_estimate'],
@@ -679,10 +733,23 @@ class Event(commands.Cog):
                         'ep_per_hour': estimate['ep_per_hour']
                     }
 
-                    cutoff_data = latest_stored_cutoff['cutoff_data']
-                    cutoff_data.append(entry)
-                    await db.eventdata.update_one({"server": server, "event_id": event_id, 'tier': tier},
-                                                  {"$set": {'cutoff_data': cutoff_data}})
+                    update = {"$set": {'cutoff_model': estimate['cutoff_model']},
+                              "$push": {'cutoff_data': entry}}
+                    if estimate['rebuilt']:
+                        update['$set']['estimate_data'] = estimate['estimate_data']
+                    else:
+                        update['$push']['estimate_data'] = {'$each': estimate['new_estimate_data']}
+                    # Only apply on top of the model this update was computed from, so concurrent calls for the same
+                    # tier can't push the same points twice
+                    stored_model = latest_stored_cutoff.get('cutoff_model')
+                    query = {"server": server, "event_id": event_id, 'tier': tier}
+                    if stored_model:
+                        query['cutoff_model.last_time'] = stored_model['last_time']
+                    else:
+                        query['cutoff_model'] = {'$exists': False}
+                    result = await db.eventdata.update_one(query, update)
+                    if not result.matched_count:
+                        log.info(f'Cutoff data for server {server} event {event_id} t{tier} was already updated')
 
                     s_estimate_difference = estimate['smoothed_estimate'] - s_estimate
                     ns_estimate_difference = estimate['non_smoothed_estimate'] - ns_estimate
@@ -733,7 +800,9 @@ class Event(commands.Cog):
                     'server': server,
                     'event_id': event_id,
                     'tier': tier,
-                    'cutoff_data': cutoff_data
+                    'cutoff_data': cutoff_data,
+                    'cutoff_model': estimate['cutoff_model'],
+                    'estimate_data': estimate['estimate_data']
                 }
                 await db.eventdata.insert_one(post)
 
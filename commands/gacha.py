@@ -5,24 +5,23 @@ from discord.ext import commands
 from discord.commands import Option, SlashCommandGroup
 from discord.commands.permissions import default_permissions
 
-from httpx import AsyncClient, HTTPStatusError
-from httpx_caching import CachingClient
+from httpx import HTTPStatusError
 
 from formatting.embed import gen_embed
-from __main__ import log, db
+from __main__ import log, db, bestdori
 
 class Gacha(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.client = bestdori
         self.character_list = []
 
     def cog_unload(self):
         pass
 
     async def fetch_api(self, url):
-        api = await self.client.get(url)
         try:
-            parsed = api.json()
+            parsed = await self.client.get_json(url)
         except json.decoder.JSONDecodeError:
             return None
         return parsed
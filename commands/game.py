@@ -13,8 +13,7 @@ from sklearn.linear_model import LinearRegression
 from datetime import timezone, timedelta
 from tabulate import tabulate
 
-from httpx import AsyncClient, HTTPStatusError
-from httpx_caching import CachingClient
+from httpx import HTTPStatusError
 
 import discord
 from discord import File
@@ -32,7 +31,7 @@ from operator import itemgetter
 
 from formatting.embed import gen_embed
 from formatting.constants import SCHOOL_NAME_DICT
-from __main__ import log, db
+from __main__ import log, db, bestdori, event_timeline
 
 
 def get_xp_from_rank(rank: int) -> int:
@@ -128,12 +127,10 @@ def get_song_meta_rows(song_meta_api: dict, song_name_api: dict, song_id: str, f
 class Game(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.client = AsyncClient(follow_redirects=True)
-        self.client = CachingClient(self.client)
+        self.client = bestdori
 
     async def fetch_api(self, url):
-        api = await self.client.get(url)
-        return api.json()
+        return await self.client.get_json(url)
 
     async def generate_band_and_titles_image(self, member_situations: list, equipped_title_ids: list, server: str):
         icon_paths = []
@@ -729,29 +726,12 @@ class Game(commands.Cog):
                 ephemeral=True)
 
     async def get_current_event_id(self, server: int):
-        current_time = time.time() * 1000
-        current_event_id = ''
-        api = await self.fetch_api('https://bestdori.com/api/events/all.5.json')
-        for event in api:
-            if api[event]['startAt'][server]:
-                if float(api[event]['startAt'][server]) < current_time < float(api[event]['endAt'][server]):
-                    current_event_id = event
-                    break
-        if not current_event_id:
-            try:
-                for event in api:
-                    try:
-                        if current_time < float(api[event]['startAt'][server]):
-                            current_event_id = event
-                            break
-                    except TypeError:  # For between events
-                        continue
-            except KeyError:
-                current_event_id = list(api.keys())[-1]
-        if current_event_id:
-            return current_event_id
-        else:
-            return 0
+        await event_timeline.wait_ready()
+        # For between events, show the next one
+        event = event_timeline.current(server) or event_timeline.next(server)
+        if event:
+            return event.event_id
+        return 0
 
     async def get_event_time_left_sec(self, server: int, eventid: int):
         current_time = time.time() * 1000.0
@@ -1,12 +1,118 @@
 import discord
-import re
+import io
 import math
 import time
 import asyncio
 import datetime
+import collections
 
 from formatting.embed import gen_embed
-from __main__ import check_document, default_prefix, bot, db, log, get_prefix
+from commands.administration import strike_counts
+from __main__ import check_document, default_prefix, bot, log, guild_settings
+
+
+class LogSink:
+    """Queues log embeds for one log channel and sends them packed up to 10 per message.
+    Sends are paced by a token bucket matching Discord's per-channel limit of 5 messages every 5 seconds, and events
+    arriving within linger seconds of each other are coalesced into the same messages.
+    """
+
+    def __init__(self, channel, rate=5, per=5.0, linger=1.0):
+        self.channel = channel
+        self.rate = rate
+        self.per = per
+        self.linger = linger
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.queue = collections.deque()
+        self._task = None
+
+    def put(self, embed, file=None):
+        self.queue.append((embed, file))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+
+    async def _acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+
+    def _next_batch(self):
+        embed, file = self.queue.popleft()
+        if file:
+            return [embed], file
+        batch = [embed]
+        size = len(embed)
+        while self.queue and len(batch) < 10 and self.queue[0][1] is None:
+            size += len(self.queue[0][0])
+            if size > 6000:
+                break
+            batch.append(self.queue.popleft()[0])
+        return batch, None
+
+    async def _drain(self):
+        await asyncio.sleep(self.linger)
+        while self.queue:
+            await self._acquire()
+            embeds, file = self._next_batch()
+            try:
+                if file:
+                    await self.channel.send(embeds=embeds, file=file)
+                else:
+                    await self.channel.send(embeds=embeds)
+            except discord.HTTPException as e:
+                log.info(f'Error occurred while sending logs to {self.channel.id}: {e}')
+
+
+log_sinks = {}
+
+
+def get_log_sink(channel):
+    sink = log_sinks.get(channel.id)
+    if sink is None:
+        sink = log_sinks[channel.id] = LogSink(channel)
+    sink.channel = channel
+    return sink
+
+
+# Bulk deletes with more loggable messages than this are logged as one text file instead of an embed per message
+BULK_DELETE_FILE_THRESHOLD = 20
+
+
+def deleted_message_embed(message):
+    sent_time = math.trunc(time.mktime(message.created_at.timetuple()))
+    content = gen_embed(name=f'{message.author.name} ({message.author.display_name})',
+                        icon_url=message.author.display_avatar.url,
+                        title=f'Message deleted in #{message.channel.name}',
+                        content=f'Message sent <t:{sent_time}>')
+    content.add_field(name='Content',
+                      value=message.clean_content,
+                      inline=False)
+    content.add_field(name='ID',
+                      value=f'```ml\nUser = {message.author.id}\nMessage = {message.id}```',
+                      inline=False)
+    content.set_footer(text=time.ctime())
+    if len(message.attachments) > 0:
+        content.add_field(name="Attachment:", value="\u200b")
+        content.set_image(url=message.attachments[0].proxy_url)
+    return content
+
+
+def deleted_messages_file(messages):
+    lines = []
+    for message in messages:
+        lines.append(f'[{message.created_at:%Y-%m-%d %H:%M:%S}] {message.author.name} ({message.author.id}) '
+                     f'in #{message.channel.name} | Message = {message.id}')
+        lines.append(message.clean_content)
+        for attachment in message.attachments:
+            lines.append(f'Attachment: {attachment.proxy_url}')
+        lines.append('')
+    return discord.File(io.BytesIO('\n'.join(lines).encode('utf-8')), filename='deleted_messages.txt')
 
 
 async def on_guild_join(guild):
@@ -57,7 +163,7 @@ async def on_guild_join(guild):
 
 async def on_message_delete(message):
     try:
-        document = await db.servers.find_one({"server_id": message.guild.id})
+        document = await guild_settings.get(message.guild.id)
     except AttributeError:
         return
 
@@ -70,25 +176,10 @@ async def on_message_delete(message):
                 enabled = document['log_messages']
             if enabled:
                 if not message.author.id == bot.user.id and message.author.bot is False:
-                    prefix = await get_prefix(bot, message)
-                    if re.match(f'^{prefix}', message.content) is None:
+                    prefix = document['prefix'] or default_prefix
+                    if not message.content.startswith(prefix):
                         log_channel = message.guild.get_channel(msglog)
-                        sent_time = math.trunc(time.mktime(message.created_at.timetuple()))
-                        content = gen_embed(name=f'{message.author.name} ({message.author.display_name})',
-                                            icon_url=message.author.display_avatar.url,
-                                            title=f'Message deleted in {message.channel.name}',
-                                            content=f'Message sent <t:{sent_time}>')
-                        content.add_field(name='Content',
-                                          value=message.clean_content,
-                                          inline=False)
-                        content.add_field(name='ID',
-                                          value=f'```ml\nUser = {message.author.id}\nMessage = {message.id}```',
-                                          inline=False)
-                        content.set_footer(text=time.ctime())
-                        if len(message.attachments) > 0:
-                            content.add_field(name="Attachment:", value="\u200b")
-                            content.set_image(url=message.attachments[0].proxy_url)
-                        await log_channel.send(embed=content)
+                        get_log_sink(log_channel).put(deleted_message_embed(message))
     except TypeError:
         pass
     except Exception as e:
@@ -97,7 +188,7 @@ async def on_message_delete(message):
 
 
 async def on_bulk_message_delete(messages):
-    document = await db.servers.find_one({"server_id": messages[0].guild.id})
+    document = await guild_settings.get(messages[0].guild.id)
     try:
         if document['log_messages'][1]:
             msglog = int(document['log_messages'][1])
@@ -106,28 +197,22 @@ async def on_bulk_message_delete(messages):
             except TypeError:
                 enabled = document['log_messages']
             if enabled:
-                for message in messages:
-                    if not message.author.id == bot.user.id and message.author.bot is False:
-                        prefix = await get_prefix(bot, message)
-                        if re.match(f'^{prefix}', message.content) is None:
-                            log_channel = message.guild.get_channel(msglog)
-                            sent_time = math.trunc(time.mktime(message.created_at.timetuple()))
-                            content = gen_embed(name=f'{message.author.name} ({message.author.display_name})',
-                                                icon_url=message.author.display_avatar.url,
-                                                title=f'Message deleted in #{message.channel.name}',
-                                                content=f'Message sent <t:{sent_time}>')
-                            content.add_field(name='Content',
-                                              value=message.clean_content,
-                                              inline=False)
-                            content.add_field(name='ID',
-                                              value=f'```ml\nUser = {message.author.id}\nMessage = {message.id}```',
-                                              inline=False)
-                            content.set_footer(text=time.ctime())
-                            if len(message.attachments) > 0:
-                                content.add_field(name="Attachment:", value="\u200b")
-                                content.set_image(url=message.attachments[0].proxy_url)
-                            await log_channel.send(embed=content)
-                            await asyncio.sleep(1)
+                # Every message in a bulk delete comes from the same guild, so resolve the prefix once
+                prefix = document['prefix'] or default_prefix
+                logged = [message for message in messages
+                          if message.author.id != bot.user.id and message.author.bot is False
+                          and not message.content.startswith(prefix)]
+                if not logged:
+                    return
+                log_sink = get_log_sink(messages[0].guild.get_channel(msglog))
+                if len(logged) > BULK_DELETE_FILE_THRESHOLD:
+                    content = gen_embed(title=f'{len(logged)} messages bulk deleted in #{logged[0].channel.name}',
+                                        content='Deleted messages are attached.')
+                    content.set_footer(text=time.ctime())
+                    log_sink.put(content, file=deleted_messages_file(logged))
+                else:
+                    for message in logged:
+                        log_sink.put(deleted_message_embed(message))
     except TypeError:
         pass
     except Exception as e:
@@ -137,7 +222,7 @@ async def on_bulk_message_delete(messages):
 
 async def on_raw_message_delete(payload):
     if payload.guild_id:
-        document = await db.servers.find_one({"server_id": payload.guild_id})
+        document = await guild_settings.get(payload.guild_id)
         try:
             if document['log_messages'][1]:
                 msglog = int(document['log_messages'][1])
@@ -151,7 +236,7 @@ async def on_raw_message_delete(payload):
                         log_channel = guild.get_channel(msglog)
                         content = gen_embed(title=f'Message deleted in #{guild.get_channel(payload.channel_id).name}',
                                             content=f'```ml\nMessage ID = {payload.message_id}```')
-                        await log_channel.send(embed=content)
+                        get_log_sink(log_channel).put(content)
         except TypeError:
             pass
         except Exception as e:
@@ -161,7 +246,7 @@ async def on_raw_message_delete(payload):
 
 async def on_message_edit(before, after):
     try:
-        document = await db.servers.find_one({'server_id': before.guild.id})
+        document = await guild_settings.get(before.guild.id)
     except AttributeError:
         # prevent error when "editing ephemerals"
         return
@@ -192,12 +277,118 @@ async def on_message_edit(before, after):
                                       value=f'```ml\nUser = {after.author.id}\nMessage = {after.id}```',
                                       inline=False)
                     content.set_footer(text=time.ctime())
-                    await log_channel.send(embed=content)
+                    get_log_sink(log_channel).put(content)
+
+
+# Join raid handling. Once more than JOIN_BURST_THRESHOLD members join a guild within JOIN_BURST_WINDOW seconds, joins
+# are queued and handled together every JOIN_BURST_INTERVAL seconds until the rate drops back under the threshold.
+JOIN_BURST_THRESHOLD = 10
+JOIN_BURST_WINDOW = 60
+JOIN_BURST_INTERVAL = 15
+
+
+class JoinBurst:
+    def __init__(self, guild):
+        self.guild = guild
+        self.joins = collections.deque()
+        self.pending = []
+        self.active = False
+        self._task = None
+
+    def record(self):
+        now = time.monotonic()
+        self.joins.append(now)
+        while self.joins and self.joins[0] < now - JOIN_BURST_WINDOW:
+            self.joins.popleft()
+        if not self.active and len(self.joins) > JOIN_BURST_THRESHOLD:
+            log.info(f'Join burst detected in {self.guild.name}, batching member joins')
+            self.active = True
+        return self.active
+
+    def put(self, member):
+        self.pending.append(member)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def _subsided(self):
+        now = time.monotonic()
+        while self.joins and self.joins[0] < now - JOIN_BURST_WINDOW:
+            self.joins.popleft()
+        return len(self.joins) <= JOIN_BURST_THRESHOLD
+
+    async def _run(self):
+        while self.active:
+            await asyncio.sleep(JOIN_BURST_INTERVAL)
+            members, self.pending = self.pending, []
+            if members:
+                try:
+                    await self.flush(members)
+                except Exception as e:
+                    log.info(f'Error occurred while handling join burst in {self.guild.name}: {e}')
+            if not self.pending and self._subsided():
+                log.info(f'Join burst in {self.guild.name} subsided')
+                self.active = False
+
+    async def flush(self, members):
+        document = await guild_settings.get(self.guild.id)
+        if document['autorole']:
+            role = self.guild.get_role(int(document['autorole']))
+            if role:
+                await asyncio.gather(*[member.add_roles(role) for member in members], return_exceptions=True)
+                log.info(f"Auto-assigned role to {len(members)} new members in {self.guild.name}")
+            else:
+                log.error(f"Could not find auto assign role for {self.guild.name}!")
+
+        log_channel = join_log_channel(document, self.guild)
+        if log_channel is None:
+            return
+        strikes = await strike_counts(self.guild.id, [member.id for member in members])
+        lines = []
+        for member in members:
+            account_age = (datetime.datetime.now(datetime.timezone.utc) - member.created_at).days
+            total = strikes.get(member.id, {}).get('total', 0)
+            lines.append(f'{member.mention} `{member.id}` | {account_age}d old | {total} strikes')
+        # Embed descriptions are capped at 4096 characters
+        chunks = ['']
+        for line in lines:
+            if len(chunks[-1]) + len(line) + 1 > 4000:
+                chunks.append('')
+            chunks[-1] += line + '\n'
+        log_sink = get_log_sink(log_channel)
+        for chunk in chunks:
+            content = gen_embed(title=f"{len(members)} members joined (join burst)",
+                                content=chunk,
+                                colour=0x2ecc71)
+            content.add_field(name='Member Count',
+                              value=self.guild.member_count,
+                              inline=True)
+            content.set_footer(text=time.ctime())
+            log_sink.put(content)
+
+
+join_bursts = {}
+
+
+def join_log_channel(document, guild):
+    try:
+        enabled = document['log_joinleaves'][0]
+    except TypeError:
+        enabled = document['log_joinleaves']
+    if enabled and document['log_joinleaves'][1]:
+        return guild.get_channel(int(document['log_joinleaves'][1]))
+    return None
 
 
 async def on_member_join(member):
+    burst = join_bursts.get(member.guild.id)
+    if burst is None:
+        burst = join_bursts[member.guild.id] = JoinBurst(member.guild)
+    if burst.record():
+        burst.put(member)
+        return
+
     log.info(f'A new member joined in {member.guild.name}')
-    document = await db.servers.find_one({"server_id": member.guild.id})
+    document = await guild_settings.get(member.guild.id)
     if document['autorole']:
         role = discord.utils.find(lambda r: r.id == int(document['autorole']), member.guild.roles)
         if role:
@@ -205,45 +396,36 @@ async def on_member_join(member):
             log.info(f"Auto-assigned role to new member in {member.guild.name}")
         else:
             log.error(f"Could not find auto assign role for {member.guild.name}!")
-    try:
-        enabled = document['log_joinleaves'][0]
-    except TypeError:
-        enabled = document['log_joinleaves']
-    if enabled:
-        if document['log_joinleaves'][1]:
-            msglog = int(document['log_joinleaves'][1])
-            log_channel = member.guild.get_channel(int(document['log_joinleaves'][1]))
-            content = gen_embed(name=f'{member.name}',
-                                icon_url=member.display_avatar.url,
-                                title="Member joined",
-                                content=f'{member.name} {member.mention}',
-                                colour=0x2ecc71)
-            content.add_field(name='Joined At',
-                              value=f'<t:{math.trunc(time.mktime(member.joined_at.timetuple()))}>',
-                              inline=False)
-            account_age = (datetime.datetime.now(datetime.timezone.utc) - member.created_at).days
-            content.add_field(name='Account Age',
-                              value=f'**{account_age}** days',
-                              inline=True)
-            content.add_field(name='Member Count',
-                              value=member.guild.member_count,
-                              inline=True)
-            query = {'server_id': member.guild.id, 'user_id': member.id}
-            results = db.warns.find(query)
-            results = await results.to_list(length=None)
-            results = len(results)
-            content.add_field(name='Previous Strikes',
-                              value=results,
-                              inline=True)
-            content.add_field(name='ID',
-                              value=f'```ml\nMember = {member.id}```',
-                              inline=False)
-            content.set_footer(text=time.ctime())
-            await log_channel.send(embed=content)
+    log_channel = join_log_channel(document, member.guild)
+    if log_channel:
+        content = gen_embed(name=f'{member.name}',
+                            icon_url=member.display_avatar.url,
+                            title="Member joined",
+                            content=f'{member.name} {member.mention}',
+                            colour=0x2ecc71)
+        content.add_field(name='Joined At',
+                          value=f'<t:{math.trunc(time.mktime(member.joined_at.timetuple()))}>',
+                          inline=False)
+        account_age = (datetime.datetime.now(datetime.timezone.utc) - member.created_at).days
+        content.add_field(name='Account Age',
+                          value=f'**{account_age}** days',
+                          inline=True)
+        content.add_field(name='Member Count',
+                          value=member.guild.member_count,
+                          inline=True)
+        strikes = await strike_counts(member.guild.id, [member.id])
+        content.add_field(name='Previous Strikes',
+                          value=strikes.get(member.id, {}).get('total', 0),
+                          inline=True)
+        content.add_field(name='ID',
+                          value=f'```ml\nMember = {member.id}```',
+                          inline=False)
+        content.set_footer(text=time.ctime())
+        await log_channel.send(embed=content)
 
 
 async def on_member_remove(member):
-    document = await db.servers.find_one({"server_id": member.guild.id})
+    document = await guild_settings.get(member.guild.id)
     try:
         enabled = document['log_joinleaves'][0]
     except TypeError:
@@ -273,7 +455,7 @@ async def on_member_remove(member):
 
 
 async def on_member_update(before, after):
-    document = await db.servers.find_one({'server_id': before.guild.id})
+    document = await guild_settings.get(before.guild.id)
     try:
         enabled = document['log_joinleaves'][0]
     except TypeError:
@@ -302,7 +484,7 @@ async def on_member_update(before, after):
 
 
 async def on_member_ban(guild, user):
-    document = await db.servers.find_one({'server_id': guild.id})
+    document = await guild_settings.get(guild.id)
     try:
         enabled = document['log_kbm'][0]
     except TypeError:
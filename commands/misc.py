@@ -11,7 +11,7 @@ from discord.commands import Option, SlashCommandGroup
 from discord.enums import SlashCommandOptionType
 from discord.ui import InputText, Modal
 
-from __main__ import log, db
+from __main__ import log, db, guild_settings, chat_filter, reference_resolver, bestdori, BESTDORI_HTTP2
 from formatting.embed import gen_embed
 from formatting.constants import NAME, EXTENSIONS, VERSION as BOTVERSION
 from commands.errorhandler import CheckOwner
@@ -268,7 +268,7 @@ class Miscellaneous(commands.Cog):
         await db.msgid.delete_many({'server_id': guild.id})
         await db.warns.delete_many({'server_id': guild.id})
         await db.rolereact.delete_many({'server_id': guild.id})
-        await db.servers.delete_one({'server_id': guild.id})
+        await guild_settings.delete_one({'server_id': guild.id})
         await db.emoji.delete_many({'server_id': guild.id})
         await db.reminders.delete_many({'server_id': guild.id})
         await guild.leave()
@@ -308,6 +308,51 @@ class Miscellaneous(commands.Cog):
                             content=f'```{embed_content}```'),
             ephemeral=True)
 
+    @discord.slash_command(name='messageroutes',
+                           description='Message routing stats, DEV ONLY')
+    @is_owner()
+    async def messageroutes(self,
+                            ctx: discord.ApplicationContext):
+        await ctx.interaction.response.defer()
+        embed_content = ''
+        for route, count in self.bot.route_counts.most_common():
+            embed_content += f'{count} | {route}\n'
+        embed_content += '\nReply lookups:\n'
+        for source, count in reference_resolver.stats.most_common():
+            embed_content += f'{count} | {source}\n'
+        await ctx.interaction.followup.send(
+            embed=gen_embed(title='Message Routes',
+                            content=f'```{embed_content}```'),
+            ephemeral=True)
+
+    @discord.slash_command(name='chatfilter',
+                           description='Chat filter rejection stats, DEV ONLY')
+    @is_owner()
+    async def chatfilter(self,
+                         ctx: discord.ApplicationContext):
+        await ctx.interaction.response.defer()
+        embed_content = f'Checked: {chat_filter.checked}\n'
+        for rule, count in chat_filter.stats.most_common(15):
+            embed_content += f'{count} | {rule}\n'
+        await ctx.interaction.followup.send(
+            embed=gen_embed(title='Chat Filter',
+                            content=f'```{embed_content}```'),
+            ephemeral=True)
+
+    @discord.slash_command(name='bestdoristats',
+                           description='Bestdori client cache stats, DEV ONLY')
+    @is_owner()
+    async def bestdoristats(self,
+                            ctx: discord.ApplicationContext):
+        await ctx.interaction.response.defer()
+        embed_content = f'HTTP/2: {BESTDORI_HTTP2}\n'
+        for stat, count in bestdori.stats.most_common():
+            embed_content += f'{count} | {stat}\n'
+        await ctx.interaction.followup.send(
+            embed=gen_embed(title='Bestdori Client',
+                            content=f'```{embed_content}```'),
+            ephemeral=True)
+
     @discord.slash_command(name='objgraph',
                            description='Object graph, DEV ONLY')
     @is_owner()
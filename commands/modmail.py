@@ -4,7 +4,7 @@ import asyncio
 from discord.ext import commands, tasks
 from discord.commands import Option
 from formatting.embed import gen_embed, embed_splitter
-from __main__ import log, db
+from __main__ import log, db, guild_settings
 
 
 # Define a simple View that gives us a confirmation menu
@@ -186,8 +186,8 @@ class Modmail(commands.Cog):
             self.view = ModmailButton(bot=self.bot)
             new_message = await channel.send("Send a modmail to us by pressing the button below.", view=self.view)
             log.info('initial posted')
-            await db.servers.update_one({"server_id": server_id},
-                                        {"$set": {'prev_message_modmail': new_message.id}})
+            await guild_settings.update_one({"server_id": server_id},
+                                            {"$set": {'prev_message_modmail': new_message.id}})
 
     @modmail_button.before_loop
     async def wait_ready(self):
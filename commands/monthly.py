@@ -10,8 +10,7 @@ from datetime import datetime, timezone, timedelta
 from dateutil.relativedelta import relativedelta
 from tabulate import tabulate
 
-from httpx import AsyncClient, HTTPStatusError
-from httpx_caching import CachingClient
+from httpx import HTTPStatusError
 
 from PIL import Image
 from PIL.ImageDraw import Draw
@@ -29,7 +28,7 @@ from discord import default_permissions
 
 from formatting.embed import gen_embed
 
-from __main__ import log, db
+from __main__ import log, db, bestdori
 from commands.update import Update
 
 
@@ -153,13 +152,11 @@ class MonthlyPlayerView(discord.ui.DesignerView):
 class Monthly(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.client = AsyncClient(follow_redirects=True)
-        self.client = CachingClient(self.client)
+        self.client = bestdori
 
 
     async def fetch_api(self, url):
-        api = await self.client.get(url)
-        return api.json()
+        return await self.client.get_json(url)
 
 
     # taken from game.py and adjusted to fit the needs and new Pillow version; not an exact duplicate due to different format 
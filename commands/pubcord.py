@@ -2,16 +2,13 @@ import time
 import asyncio
 import datetime
 
-from httpx import AsyncClient
-from httpx_caching import CachingClient
-
 import discord
 from discord.ext import commands, tasks
 from discord.commands import Option, SlashCommandGroup
 from discord.commands.permissions import default_permissions
 
 from formatting.embed import gen_embed
-from __main__ import log, db
+from __main__ import log, db, guild_settings, bestdori, event_timeline
 from commands.errorhandler import CheckOwner
 
 
@@ -75,21 +72,13 @@ class SpecialRole(discord.ui.View):
 
 
 async def get_next_event():
-    current_time = time.time() * 1000
-
-    url = 'https://bestdori.com/api/events/all.5.json'
-    client = AsyncClient(follow_redirects=True)
-    client = CachingClient(client)
-
-    r = await client.get(url)
-    api = r.json()
-    event_start_dates = {}
-    for event in api:
-        if api[event]['startAt'][1]:
-            event_start_dates[event] = api[event]['startAt'][1]
-    res_key, res_val = min(event_start_dates.items(), key=lambda x: abs(current_time - float(x[1])))
-    log.info(f'Current event ID: {res_key}')
-    return res_key
+    if not await event_timeline.wait_ready():
+        return None
+    event = event_timeline.nearest(1)
+    if event is None:
+        return None
+    log.info(f'Current event ID: {event.event_id}')
+    return event.event_id
 
 
 class Pubcord(commands.Cog):
@@ -129,13 +118,12 @@ class Pubcord(commands.Cog):
     async def generate_current_event(force=False) -> discord.Embed | None:
         current_time = time.time() * 1000
         current_event_id = await get_next_event()
-
-        client = AsyncClient(follow_redirects=True)
-        client = CachingClient(client)
+        if current_event_id is None:
+            log.error('Event timeline unavailable, skipping current event info')
+            return
 
         events_url = f'https://bestdori.com/api/events/{current_event_id}.json'
-        r_event = await client.get(events_url)
-        event_data = r_event.json()
+        event_data = await bestdori.get_json(events_url)
 
         event_name = event_data['eventName'][1]
         event_start = event_data['startAt'][1]
@@ -161,15 +149,13 @@ class Pubcord(commands.Cog):
         for entry in event_data['characters']:
             char_id = entry['characterId']
             character_url = f'https://bestdori.com/api/characters/{char_id}.json'
-            r_char = await client.get(character_url)
-            char_data = r_char.json()
+            char_data = await bestdori.get_json(character_url)
             event_characters.append(char_data['firstName'][1])
         event_gacha = []
         event_songs = []
 
         song_url = f'https://bestdori.com/api/songs/all.5.json'
-        r_song = await client.get(song_url)
-        song_data = r_song.json()
+        song_data = await bestdori.get_json(song_url)
         for key, song in song_data.items():
             if song['publishedAt'][1]:
                 if float(event_start) <= float(song['publishedAt'][1]) < float(event_end):
@@ -179,8 +165,7 @@ class Pubcord(commands.Cog):
 
                     band_id = song['bandId']
                     band_url = f'https://bestdori.com/api/bands/all.1.json'
-                    r_band = await client.get(band_url)
-                    band_data = r_band.json()
+                    band_data = await bestdori.get_json(band_url)
                     s = {
                         'title': song['musicTitle'][1],
                         'band': band_data[str(band_id)]['bandName'][1],
@@ -189,8 +174,7 @@ class Pubcord(commands.Cog):
                     event_songs.append(s)
 
         gacha_url = f'https://bestdori.com/api/gacha/all.5.json'
-        r_gacha = await client.get(gacha_url)
-        gacha_data = r_gacha.json()
+        gacha_data = await bestdori.get_json(gacha_url)
         for key, gacha in gacha_data.items():
             if gacha['publishedAt'][1]:
                 if (float(event_start) <= float(gacha['publishedAt'][1]) < float(event_end)
@@ -302,6 +286,10 @@ class Pubcord(commands.Cog):
                 pass
 
         newcontent_embed = await self.generate_current_event(force=True)
+        if newcontent_embed is None:
+            # Replaced by update_pubcord_quicklinks when the next event is announced, or on the next re-post
+            newcontent_embed = gen_embed(title='New Event/Songs/Gacha Info',
+                                         content='Event info is unavailable right now, please check back later.')
         newcontent_content = {
             'label': 'New Event/Songs/Gacha Info',
             'style': discord.ButtonStyle.green,
@@ -329,7 +317,7 @@ class Pubcord(commands.Cog):
         new_message = await channel.send("Access quick links by clicking the buttons below!",
                                          view=self.views[str(pubcord.id)])
         log.info('initial posted')
-        await db.servers.update_one({"server_id": 432379300684103699}, {"$set": {'prev_message': new_message.id}})
+        await guild_settings.update_one({"server_id": 432379300684103699}, {"$set": {'prev_message': new_message.id}})
 
     @tasks.loop(seconds=5.0)
     async def check_announcementbulletins(self):
@@ -352,16 +340,16 @@ class Pubcord(commands.Cog):
                     new_message = await channel.send("Access quick links by clicking the buttons below!",
                                                      view=self.views[str(pubcord.id)])
                     log.info('posted')
-                    await db.servers.update_one({"server_id": 432379300684103699},
-                                                {"$set": {'prev_message': new_message.id}})
+                    await guild_settings.update_one({"server_id": 432379300684103699},
+                                                    {"$set": {'prev_message': new_message.id}})
             except discord.NotFound:
                 log.info(f'could not find previous announcement bulletin for {pubcord.name}')
 
                 new_message = await channel.send("Access quick links by clicking the buttons below!",
                                                  view=self.views[str(pubcord.id)])
                 log.info('posted')
-                await db.servers.update_one({"server_id": 432379300684103699},
-                                            {"$set": {'prev_message': new_message.id}})
+                await guild_settings.update_one({"server_id": 432379300684103699},
+                                                {"$set": {'prev_message': new_message.id}})
             except discord.Forbidden:
                 log.error('Permission Error while attempting to delete stale announcement bulletin')
             except discord.HTTPException:
@@ -401,8 +389,8 @@ class Pubcord(commands.Cog):
             new_message = await channel.send("Access quick links by clicking the buttons below!",
                                              view=self.views[str(pubcord.id)])
             log.info(f'posted announcement bulletin for {pubcord.name}')
-            await db.servers.update_one({"server_id": 432379300684103699},
-                                        {"$set": {'prev_message': new_message.id}})
+            await guild_settings.update_one({"server_id": 432379300684103699},
+                                            {"$set": {'prev_message': new_message.id}})
 
     @tasks.loop(seconds=120)
     async def check_boosters(self):
@@ -594,8 +582,8 @@ class Pubcord(commands.Cog):
         new_message = await channel.send("Access quick links by clicking the buttons below!",
                                          view=self.views[str(pubcord.id)])
         log.info(f'posted announcement bulletin for {pubcord.name}')
-        await db.servers.update_one({"server_id": 432379300684103699},
-                                    {"$set": {'prev_message': new_message.id}})
+        await guild_settings.update_one({"server_id": 432379300684103699},
+                                        {"$set": {'prev_message': new_message.id}})
         await ctx.interaction.followup.send('New content embed has been updated with new image!',
                                             ephemeral=True)
 
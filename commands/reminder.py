@@ -1,4 +1,5 @@
 import asyncio
+import heapq
 import time
 import re
 import datetime
@@ -139,12 +140,60 @@ def humanize_timedelta(*, timedelta: Optional[datetime.timedelta] = None, second
     return ", ".join(strings)
 
 
+async def reserve_nids(count: int = 1) -> int:
+    """
+    Atomically reserve a block of reminder ids.
+    Parameters
+    ----------
+    count : int
+        How many consecutive ids to reserve, e.g. one per user in a group sign-up
+    Returns
+    -------
+    int
+        The first id of the block, the block runs up to and including ``first + count - 1``
+    """
+    document = await db.counters.find_one_and_update({'_id': 'reminder_nid'},
+                                                     {'$inc': {'value': count}},
+                                                     return_document=pymongo.ReturnDocument.AFTER)
+    if document is None:
+        # First run, carry on from the old nid_index sentinel document in db.reminders
+        sentinel = await db.reminders.find_one({'nid_index': {'$exists': True}})
+        try:
+            await db.counters.insert_one({'_id': 'reminder_nid', 'value': sentinel['nid_index'] if sentinel else 0})
+        except pymongo.errors.DuplicateKeyError:
+            # Someone else seeded it first
+            pass
+        document = await db.counters.find_one_and_update({'_id': 'reminder_nid'},
+                                                         {'$inc': {'value': count}},
+                                                         return_document=pymongo.ReturnDocument.AFTER)
+    return document['value'] - count + 1
+
+
 class Reminder(commands.Cog):
     SEND_DELAY_SECONDS = 30
+    HEAP_SIZE = 1000
+    GROUP_SEND_CONCURRENCY = 10
+    MENTION_CHUNK_SIZE = 1900
+    DM_WORKERS = 10
+    DM_MAX_ATTEMPTS = 5
+    DM_RETRY_BASE_DELAY = 5
+    USER_CACHE_TTL = 600
+    USER_CACHE_SIZE = 1000
 
     def __init__(self, bot):
         self.bot = bot
         self.lock = asyncio.Lock()
+        # (future_time, _id) for the next HEAP_SIZE reminders. Every reminder due at or before horizon is in the heap,
+        # a horizon of None means the whole collection was loaded.
+        self.heap = []
+        self.horizon = None
+        self.wakeup = asyncio.Event()
+        # DM reminders are claimed under the lock and then handed to a pool of workers, failed sends are put back
+        # on the queue with exponential backoff
+        self.dm_queue = asyncio.Queue()
+        self.dm_workers = []
+        self.group_tasks = set()
+        self.user_cache = {}
         optional_in_every = r"(in\s+|every\s+)?"
         amount_and_time = r"\d+\s*(weeks?|w|days?|d|hours?|hrs|hr?|minutes?|mins?|m(?!o)|seconds?|secs?|s)"
         optional_comma_space_and = r"[\s,]*(and)?\s*"
@@ -177,132 +226,200 @@ class Reminder(commands.Cog):
 
     def cog_unload(self):
         self.check_reminders.cancel()
+        for worker in self.dm_workers:
+            worker.cancel()
 
-    async def _do_check_reminders(self):
-        # log.info('starting check for reminders')
-        stime = int(time.time())
-        to_remove = []
-        group_send = []
-
-        count = await db.reminders.estimated_document_count()
+    def schedule(self, reminder_id, future_time):
+        """Let the scheduler know about a new or moved reminder, waking it early if this one is now due first."""
+        if self.horizon is not None and future_time > self.horizon:
+            # Will be picked up by the next refill
+            return
+        heapq.heappush(self.heap, (future_time, reminder_id))
+        if self.heap[0][1] == reminder_id:
+            self.wakeup.set()
+
+    async def _refill(self):
+        reminders = db.reminders.find({'future_time': {'$exists': True}}, {'future_time': 1}) \
+            .sort('future_time', pymongo.ASCENDING).limit(self.HEAP_SIZE)
+        reminders = await reminders.to_list(length=self.HEAP_SIZE)
+        # Already sorted, so this is a valid heap
+        self.heap = [(reminder['future_time'], reminder['_id']) for reminder in reminders]
+        self.horizon = reminders[-1]['future_time'] if len(reminders) == self.HEAP_SIZE else None
+
+    async def _wait_for_due(self):
+        while True:
+            if not self.heap and self.horizon is not None:
+                await self._refill()
+            now = int(time.time())
+            if self.heap and self.heap[0][0] <= now:
+                while self.heap and self.heap[0][0] <= now:
+                    heapq.heappop(self.heap)
+                return
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
 
-        if count > 0:
-            query = {'future_time': {'$lt': stime}}
-            reminders = db.reminders.find(query)
+    @staticmethod
+    def next_fire_time(future_time, repeat, now):
+        """First time after now on the repeat schedule that started at future_time."""
+        if future_time > now:
+            return future_time
+        return future_time + repeat * ((now - future_time) // repeat + 1)
+
+    def _reminder_embed(self, reminder, stime):
+        delay = int(stime) - int(reminder['future_time'])
+        embed = discord.Embed(
+            title=f":bell:{' (Delayed)' if delay > self.SEND_DELAY_SECONDS else ''} Reminder! :bell:",
+            colour=0x1abc9c
+        )
+        if delay > self.SEND_DELAY_SECONDS:
+            embed.set_footer(
+                text=(f"This was supposed to send {humanize_timedelta(seconds=delay)} ago."
+                      " I might be having network or server issues, or perhaps I just started up."
+                      " Sorry about that!"))
+        embed_name = f"From {reminder['future_timestamp']} ago:"
+        if reminder['repeat']:
+            embed_name = f"Repeating reminder every {humanize_timedelta(seconds=reminder['repeat'])}:"
+        reminder_text = reminder['reminder']
+        if len(reminder_text) > 900:
+            reminder_text = reminder_text[:897] + "..."
+        embed.add_field(
+            name=embed_name,
+            value=reminder_text,
+        )
+        return embed
+
+    async def _send_group_reminders(self, group_send, stime):
+        # Reminders created through the bell share their text and times with the original, so one hash lookup per
+        # reminder is enough to group everyone that should be pinged together
+        groups = {}
+        for reminder in group_send:
+            key = (reminder['channel_id'], reminder['reminder'], reminder['future_time'],
+                   reminder['future_timestamp'])
+            groups.setdefault(key, []).append(reminder)
+        semaphore = asyncio.Semaphore(self.GROUP_SEND_CONCURRENCY)
+
+        async def send_group(reminders):
+            # Raw mentions don't need the users to be resolved first
+            user_mentions = [f'<@{user_id}>' for user_id in dict.fromkeys(r['user_id'] for r in reminders)]
+            mention_chunks = ['']
+            for mention in user_mentions:
+                if len(mention_chunks[-1]) + len(mention) > self.MENTION_CHUNK_SIZE:
+                    mention_chunks.append('')
+                mention_chunks[-1] += mention
+            async with semaphore:
+                try:
+                    channel = self.bot.get_channel(reminders[0]['channel_id'])
+                    for chunk in mention_chunks:
+                        await channel.send(chunk)
+                    await channel.send(embed=self._reminder_embed(reminders[0], stime))
+                except Exception as e:
+                    log.error('Error occurred while sending group reminder. Channel may not exist or is missing.')
+
+        await asyncio.gather(*[send_group(reminders) for reminders in groups.values()])
+
+    async def _resolve_user(self, user_id):
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            return user
+        cached = self.user_cache.get(user_id)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        try:
+            user = await self.bot.fetch_user(user_id)
+        except discord.NotFound:
+            user = None
+        # Other HTTP errors propagate so the delivery gets retried instead of caching a miss
+        if len(self.user_cache) >= self.USER_CACHE_SIZE:
+            now = time.monotonic()
+            self.user_cache = {k: v for k, v in self.user_cache.items() if v[0] > now}
+            while len(self.user_cache) >= self.USER_CACHE_SIZE:
+                del self.user_cache[next(iter(self.user_cache))]
+        self.user_cache[user_id] = (time.monotonic() + self.USER_CACHE_TTL, user)
+        return user
+
+    def _retry_dm(self, reminder, attempt):
+        if attempt >= self.DM_MAX_ATTEMPTS:
+            log.error(f"Giving up on reminder dm to user {reminder['user_id']} after {attempt} attempts")
+            return
+        delay = self.DM_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+        asyncio.get_running_loop().call_later(delay, self.dm_queue.put_nowait, (reminder, attempt))
 
-            async for reminder in reminders:
-                user = await self.bot.get_or_fetch_user(reminder['user_id'])
-                if user is None:
-                    to_remove.append(reminder)
+    async def _dm_worker(self):
+        while True:
+            reminder, attempt = await self.dm_queue.get()
+            try:
+                user = await self._resolve_user(reminder['user_id'])
+                if user is not None:
+                    await user.send(embed=self._reminder_embed(reminder, int(time.time())))
+            except discord.Forbidden:
+                # Can't send DMs to user, the reminder has already been claimed so just drop it
+                log.error('Could not send reminder dm to user, deleting reminder')
+            except discord.HTTPException:
+                # Something weird happened: retry later
+                self._retry_dm(reminder, attempt + 1)
+            except Exception as e:
+                log.error(f'Error occurred while sending reminder dm: {e}')
+            finally:
+                self.dm_queue.task_done()
+
+    def _start_dm_workers(self):
+        if not self.dm_workers:
+            self.dm_workers = [asyncio.create_task(self._dm_worker()) for _ in range(self.DM_WORKERS)]
+
+    async def _claim_due_reminders(self):
+        # Advance or delete everything that is due before delivering anything, so the lock only covers the DB work
+        stime = int(time.time())
+        query = {'future_time': {'$lte': stime}}
+        reminders = await db.reminders.find(query).to_list(length=None)
+
+        if reminders:
+            now = int(time.time())
+            requests = []
+            rescheduled = []
+            for reminder in reminders:
+                if reminder['repeat']:
+                    future_time = self.next_fire_time(reminder['future_time'], reminder['repeat'], now)
+                    requests.append(pymongo.UpdateOne(
+                        {'_id': reminder['_id']},
+                        {'$set': {'future_time': future_time,
+                                  'future_timestamp': humanize_timedelta(seconds=reminder['repeat']),
+                                  'creation_time': time.time()}}))
+                    rescheduled.append((reminder['_id'], future_time))
                 else:
-                    delay = int(stime) - int(reminder['future_time'])
-                    embed = discord.Embed(
-                        title=f":bell:{' (Delayed)' if delay > self.SEND_DELAY_SECONDS else ''} Reminder! :bell:",
-                        colour=0x1abc9c
-                    )
-                    if delay > self.SEND_DELAY_SECONDS:
-                        embed.set_footer(
-                            text=(f"This was supposed to send {humanize_timedelta(seconds=delay)} ago."
-                                  " I might be having network or server issues, or perhaps I just started up."
-                                  " Sorry about that!"))
-                    embed_name = f"From {reminder['future_timestamp']} ago:"
-                    if reminder['repeat']:
-                        embed_name = f"Repeating reminder every {humanize_timedelta(seconds=reminder['repeat'])}:"
-                    reminder_text = reminder['reminder']
-                    if len(reminder_text) > 900:
-                        reminder_text = reminder_text[:897] + "..."
-                    embed.add_field(
-                        name=embed_name,
-                        value=reminder_text,
-                    )
-
-                    if reminder['location'] == 'channel':
-                        group_send.append(reminder)
-                    elif reminder['location'] == 'dm':
-                        try:
-                            await user.send(embed=embed)
-                        except discord.Forbidden:
-                            # Can't send DMs to user, delete it
-                            log.error('Could not send reminder dm to user, deleting reminder')
-                            to_remove.append(reminder)
-                        except discord.HTTPException:
-                            # Something weird happened: retry next time
-                            pass
-                to_remove.append(reminder)
+                    requests.append(pymongo.DeleteOne({'_id': reminder['_id']}))
+            try:
+                await db.reminders.bulk_write(requests, ordered=False)
+            except pymongo.errors.BulkWriteError as e:
+                log.error(f'Failed to update {len(e.details["writeErrors"])} fired reminders')
+            for reminder_id, future_time in rescheduled:
+                self.schedule(reminder_id, future_time)
+        return reminders, stime
+
+    def _deliver(self, reminders, stime):
+        group_send = []
+        for reminder in reminders:
+            if reminder['location'] == 'channel':
+                group_send.append(reminder)
+            elif reminder['location'] == 'dm':
+                self.dm_queue.put_nowait((reminder, 0))
 
         if group_send:
-            # take first reminder in list - check every other. if match, pop and save user id
-            # send message with mentions first - then send embed
-            # repeat until list is empty
-            def group_reminder_exists(current_reminder, new_reminder):
-                if (
-                        current_reminder['reminder'] == new_reminder['reminder']
-                        and current_reminder['future_time'] == new_reminder['future_time']
-                        and current_reminder['future_timestamp'] == new_reminder['future_timestamp']
-                ):
-                    return True
-                return False
-
-            async def send_group_reminders(group_send_list):
-                while len(group_send_list) != 0:
-                    base_reminder = group_send_list.pop(0)
-                    user_mentions = []
-                    buser = await self.bot.get_or_fetch_user(base_reminder['user_id'])
-                    user_mentions.append(buser.mention)
-                    for greminder in group_send_list[:]:
-                        if group_reminder_exists(base_reminder, greminder):
-                            guser = self.bot.get_user(greminder['user_id'])
-                            if guser is None:
-                                pass
-                            user_mentions.append(guser.mention)
-                            group_send_list.remove(greminder)
-
-                    gdelay = int(stime) - int(base_reminder['future_time'])
-                    gembed = discord.Embed(
-                        title=f":bell:{' (Delayed)' if delay > self.SEND_DELAY_SECONDS else ''} Reminder! :bell:",
-                        colour=0x1abc9c
-                    )
-                    if gdelay > self.SEND_DELAY_SECONDS:
-                        gembed.set_footer(
-                            text=(f"This was supposed to send {humanize_timedelta(seconds=delay)} ago."
-                                  " I might be having network or server issues, or perhaps I just started up."
-                                  " Sorry about that!"))
-                    gembed_name = f"From {base_reminder['future_timestamp']} ago:"
-                    if base_reminder['repeat']:
-                        gembed_name = f"Repeating reminder every {humanize_timedelta(seconds=base_reminder['repeat'])}:"
-                    greminder_text = base_reminder['reminder']
-                    if len(greminder_text) > 900:
-                        greminder_text = greminder_text[:897] + "..."
-                    gembed.add_field(
-                        name=gembed_name,
-                        value=greminder_text,
-                    )
-                    try:
-                        channel = self.bot.get_channel(base_reminder['channel_id'])
-                        await channel.send(f"{''.join(user_mentions)}")
-                        await channel.send(embed=embed)
-                    except Exception as e:
-                        log.error('Error occurred while sending group reminder. Channel may not exist or is missing.')
-
-            await send_group_reminders(group_send)
-
-        if to_remove:
-            for reminder in to_remove:
-                if reminder['repeat']:
-                    while reminder['future_time'] <= int(time.time()):
-                        reminder['future_time'] += reminder['repeat']
-                    reminder['future_timestamp'] = humanize_timedelta(seconds=reminder['repeat'])
-                    reminder['creation_time'] = time.time()
-                    await db.reminders.replace_one({'user_id': reminder['user_id'], 'nid': reminder['nid']},
-                                                   reminder)
-                else:
-                    await db.reminders.delete_one({'user_id': reminder['user_id'], 'nid': reminder['nid']})
+            task = asyncio.create_task(self._send_group_reminders(group_send, stime))
+            self.group_tasks.add(task)
+            task.add_done_callback(self.group_tasks.discard)
 
-    @tasks.loop(seconds=10)
+    @tasks.loop(seconds=0)
     async def check_reminders(self):
+        # Sleeps until the earliest reminder in the heap is due, or until schedule() wakes us for an earlier one
+        await self._wait_for_due()
         # start = timer()
         async with self.lock:
-            await self._do_check_reminders()
+            reminders, stime = await self._claim_due_reminders()
+        self._deliver(reminders, stime)
         # end = timer()
         # log.info(f'{end - start}') (timing purposes)
 
@@ -310,6 +427,8 @@ class Reminder(commands.Cog):
     async def wait_ready(self):
         # log.info('wait till ready')
         await self.bot.wait_until_ready()
+        self._start_dm_workers()
+        await self._refill()
 
     remind = SlashCommandGroup('remind', 'Manage your reminders.')
     edit = remind.create_subgroup(name='edit', description='Edit your reminders')
@@ -525,6 +644,7 @@ class Reminder(commands.Cog):
         future_timestamp = humanize_timedelta(timedelta=time_delta)
         await db.reminders.update_one({'user_id': ctx.author.id, "nid": reminder_id},
                                       {"$set": {'future_time': future, 'future_timestamp': future_timestamp}})
+        self.schedule(reminder['_id'], future)
         message = f"Reminder {reminder_id} will now remind you in {future_timestamp}"
         if reminder['repeat']:
             message += f", repeating every {humanize_timedelta(seconds=reminder['repeat'])} thereafter."
@@ -602,10 +722,7 @@ class Reminder(commands.Cog):
         future_timeunix = int(time.time() + reminder_time.total_seconds())
         future_timestamp = humanize_timedelta(timedelta=reminder_time)
 
-        query = {'nid_index': {"$exists": True}}
-        qdocument = await db.reminders.find_one(query)
-        old_nid = qdocument['nid_index']
-        nid = old_nid + 1
+        nid = await reserve_nids()
         post = {
             'nid': nid,
             'user_id': ctx.author.id,
@@ -619,7 +736,7 @@ class Reminder(commands.Cog):
             'location': location
         }
         reminder = await db.reminders.insert_one(post)
-        await db.reminders.update_one({"nid_index": old_nid}, {"$set": {'nid_index': nid}})
+        self.schedule(reminder.inserted_id, future_timeunix)
 
         message = f"I will remind you of {'that' if reminder_text else 'this'} "
         if repeat:
@@ -637,7 +754,7 @@ class Reminder(commands.Cog):
             title='Want to be reminded too?',
             content=(f"If anyone else would like {'these reminders' if repeat else 'to be reminded'}"
                      f" as well, click the bell below!")))
-        db.reminders.update_one({"_id": reminder.inserted_id}, {"$set": {'query_id': query.id}})
+        await db.reminders.update_one({"_id": reminder.inserted_id}, {"$set": {'query_id': query.id}})
         await query.add_reaction('\N{BELL}')
         await query.delete(delay=30.0)
 
@@ -797,20 +914,6 @@ class Reminder(commands.Cog):
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload):
-        async def reminder_exists(new_reminder):
-            async for document in db.reminders.find():
-                try:
-                    if (
-                            document['user_id'] == new_reminder['user_id']
-                            and document['reminder'] == new_reminder['reminder']
-                            and document['future_time'] == new_reminder['future_time']
-                            and document['future_timestamp'] == new_reminder['future_timestamp']
-                    ):
-                        return True
-                    return False
-                except KeyError:
-                    continue
-
         if not payload.guild_id:
             return
         if str(payload.emoji) != "\N{BELL}":
@@ -834,27 +937,24 @@ class Reminder(commands.Cog):
             future_time = found_reminder['future_time']
             future_timestamp = found_reminder['future_timestamp']
             location = found_reminder['location']
-            query = {'nid_index': {"$exists": True}}
-            qdocument = await db.reminders.find_one(query)
-            old_nid = qdocument['nid_index']
-            nid = old_nid + 1
-            channel = guild.get_channel(payload.channel_id)
+            # Sign-ups keep the query message id, so the unique (user_id, query_id) index rejects a second click
             post = {
-                'nid': nid,
+                'nid': await reserve_nids(),
                 'user_id': member.id,
-                'channel_id': channel,
+                'channel_id': payload.channel_id,
                 'creation_date': time.time(),
                 'reminder': reminder_text,
                 'repeat': repeat,
                 'future_time': future_time,
                 'future_timestamp': future_timestamp,
-                'query_id': None,
+                'query_id': payload.message_id,
                 'location': location
             }
-            if await reminder_exists(post):
+            try:
+                reminder = await db.reminders.insert_one(post)
+            except pymongo.errors.DuplicateKeyError:
                 return
-            await db.reminders.insert_one(post)
-            await db.reminders.update_one({'nid_index': old_nid}, {"$set": {'nid_index': nid}})
+            self.schedule(reminder.inserted_id, future_time)
             message = 'Hello! I will also send you '
             if post['repeat']:
                 human_repeat = humanize_timedelta(seconds=post["repeat"])
@@ -1,18 +1,14 @@
-import time
 import asyncio
 import datetime
 from datetime import timedelta
 
-from httpx import AsyncClient
-from httpx_caching import CachingClient
-
 import discord
 from discord.ext import commands, tasks
 from discord.commands import Option, SlashCommandGroup
 from discord.commands.permissions import default_permissions
 
 from formatting.embed import gen_embed, embed_splitter
-from __main__ import log, db
+from __main__ import log, db, guild_settings, event_timeline
 from commands.errorhandler import CheckOwner
 
 
@@ -223,8 +219,8 @@ class Collection(commands.Cog):
                                                   f"Missing: {missing}"),
                                                  view=self.view)
             log.info('Initial t100 screenshot button posted')
-            await db.servers.update_one({"server_id": 432379300684103699},
-                                        {"$set": {'prev_message_screenshot': new_message.id, 'missing': missing}})
+            await guild_settings.update_one({"server_id": 432379300684103699},
+                                            {"$set": {'prev_message_screenshot': new_message.id, 'missing': missing}})
 
     @tasks.loop(seconds=300)
     async def checkscreenshot_button(self):
@@ -243,8 +239,8 @@ class Collection(commands.Cog):
                                                   f"Missing: {missing}"),
                                                  view=self.view)
                 log.info('New t100 screenshot button posted')
-                await db.servers.update_one({"server_id": 432379300684103699},
-                                            {"$set": {'prev_message_screenshot': new_message.id, 'missing': missing}})
+                await guild_settings.update_one({"server_id": 432379300684103699},
+                                                {"$set": {'prev_message_screenshot': new_message.id, 'missing': missing}})
         else:
             tid = document['prev_message_screenshot']
             log.info(f"prev t100 message id: {tid}")
@@ -265,27 +261,19 @@ class Collection(commands.Cog):
                     log.info('Event timestamp exceeded, screenshot button deleted')
                 except discord.NotFound:
                     log.info('Screenshot button not found, ignoring')
-                await db.servers.update_one({"server_id": 432379300684103699},
-                                            {"$set": {'prev_message_screenshot': None}})
+                await guild_settings.update_one({"server_id": 432379300684103699},
+                                                {"$set": {'prev_message_screenshot': None}})
 
     @tasks.loop(hours=24)
     async def update_endofevent(self):
-        current_time = time.time() * 1000
-
-        url = 'https://bestdori.com/api/events/all.5.json'
-        client = AsyncClient()
-        client = CachingClient(client)
-
-        r = await client.get(url)
-        api = r.json()
-        for event in api:
-            if api[event]['startAt'][1]:
-                if float(api[event]['startAt'][1]) < current_time < float(api[event]['endAt'][1]):
-                    end_time = int((int(api[event]['endAt'][1])) / 1000)
-                    end_time = datetime.datetime.fromtimestamp(end_time, datetime.timezone.utc)
-                    await db.servers.update_one({"server_id": 432379300684103699},
-                                                {"$set": {'end_of_event': end_time}})
-                    log.info(f"Set end of event to {end_time}")
+        await event_timeline.wait_ready()
+        event = event_timeline.current(1)
+        if event:
+            end_time = int(int(event.end) / 1000)
+            end_time = datetime.datetime.fromtimestamp(end_time, datetime.timezone.utc)
+            await guild_settings.update_one({"server_id": 432379300684103699},
+                                            {"$set": {'end_of_event': end_time}})
+            log.info(f"Set end of event to {end_time}")
 
     @sendscreenshot_button.before_loop
     @update_endofevent.before_loop
@@ -341,8 +329,8 @@ class Collection(commands.Cog):
             if description == "none":
                 await prev_message.edit(
                     content=f"All T100 ranking screenshots for the most recent event have been obtained! Thank you <3")
-                await db.servers.update_one({"server_id": 432379300684103699},
-                                            {"$set": {'missing': description}})
+                await guild_settings.update_one({"server_id": 432379300684103699},
+                                                {"$set": {'missing': description}})
                 await ctx.respond(embed=gen_embed(title='missing',
                                                   content=(f'Updated message content:\n\nAll T100 ranking screenshots'
                                                            ' for the most recent event have been obtained! Thank you'
@@ -352,8 +340,8 @@ class Collection(commands.Cog):
                                                  f"\nPlease check the pins in "
                                                  f"{pubcord.get_channel(432382183072858131).mention} for more info."
                                                  f"\nMissing: {description}"))
-                await db.servers.update_one({"server_id": 432379300684103699},
-                                            {"$set": {'missing': description}})
+                await guild_settings.update_one({"server_id": 432379300684103699},
+                                                {"$set": {'missing': description}})
                 await ctx.respond(embed=gen_embed(title='missing',
                                                   content=f'Updated message content:\n\nMissing: {description}.'))
         else:
@@ -369,7 +357,7 @@ class Collection(commands.Cog):
                                  ctx: discord.ApplicationContext,
                                  channel: Option(discord.SlashCommandOptionType.channel, 'Channel to set as active')):
         await ctx.interaction.response.defer()
-        await db.servers.update_one({"server_id": ctx.guild.id}, {"$set": {'modmail_channel': channel.id}})
+        await guild_settings.update_one({"server_id": ctx.guild.id}, {"$set": {'modmail_channel': channel.id}})
         await ctx.respond(embed=gen_embed(title='t100 Screenshot Collection Channel Configuration',
                                           content=f'Active channel set to {channel.mention}'))
 
@@ -1,12 +1,12 @@
 import asyncio
+import json
 import os
 import time
 import datetime
 from datetime import timezone, timedelta
 from tabulate import tabulate
 
-from httpx import AsyncClient, HTTPStatusError
-from httpx_caching import CachingClient
+from httpx import HTTPStatusError
 
 import discord
 from discord.ext import commands, tasks
@@ -20,7 +20,7 @@ from pathlib import Path
 import math
 
 from formatting.embed import gen_embed
-from __main__ import log, db
+from __main__ import log, db, bestdori, event_timeline
 
 
 # adds commas to a number to make it easier to read
@@ -55,8 +55,7 @@ def server_name(num):
 class Update(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.client = AsyncClient(follow_redirects=True)
-        self.client = CachingClient(self.client)
+        self.client = bestdori
         self.oneh_synced = False
         self.twom_synced = False
         self.t10_2m_tracking.start()
@@ -71,47 +70,27 @@ class Update(commands.Cog):
         #self.update_titles_loop.cancel()
 
     async def fetch_api(self, url):
-        api = await self.client.get(url)
-        #log.info(f'fetch_api status code: {api.status_code}')
-        if api.status_code == 503:
+        try:
+            return await self.client.get_json(url)
+        except json.decoder.JSONDecodeError:
+            # Bestdori answers with a non-JSON 503 page while it's down
             return None
-        return api.json()
 
     async def get_all_current_event(self):
+        if not await event_timeline.wait_ready():
+            return None
         current_time = time.time() * 1000
-        api = await self.fetch_api('https://bestdori.com/api/events/all.5.json')
         event_ids = []
         for i in range(5):
-            current_event_id = ''
-            if api:
-                for event in api:
-                    if api[event]['startAt'][i]:
-                        if float(api[event]['startAt'][i]) < current_time < float(api[event]['endAt'][i]):
-                            current_event_id = event
-                            current_event_name = api[event]['eventName'][i]
-                            time_left = float(api[event]['endAt'][i]) - current_time
-                            break
-                if not current_event_id:
-                    try:
-                        for event in api:
-                            try:
-                                if current_time < float(api[str(event)]['startAt'][i]):
-                                    current_event_id = event
-                                    current_event_name = api[event]['eventName'][i]
-                                    time_left = 0
-                                    break
-                            except TypeError:  # For between events
-                                continue
-                    except KeyError:
-                        current_event_id = list(api.keys())[-1]
-                        current_event_name = api[-1]['eventName'][i]
-                        time_left = 0
-                if current_event_id:
-                    event_ids.append([current_event_id, current_event_name, time_left])
-                else:
-                    event_ids.append([])
+            event = event_timeline.current(i, current_time)
+            if event:
+                event_ids.append([event.event_id, event.name, event.end - current_time])
+                continue
+            event = event_timeline.next(i, current_time)  # For between events
+            if event:
+                event_ids.append([event.event_id, event.name, 0])
             else:
-                return None
+                event_ids.append([])
         return event_ids
 
     @tasks.loop(seconds=120.0)
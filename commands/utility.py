@@ -15,7 +15,7 @@ from discord.ui import InputText
 
 from formatting.embed import gen_embed
 from formatting.constants import TIMEZONE_DICT
-from __main__ import log, db
+from __main__ import log, db, emoji_counter, EMOJI_LOG_GUILDS
 
 
 def find_key(dic, val):
@@ -193,6 +193,33 @@ class Utility(commands.Cog):
         await ctx.interaction.followup.send(f'Sent roll in {channel.name}',
                                             ephemeral=True)
 
+    @discord.slash_command(name='emojistats',
+                           description='Show the most used custom emojis in this server')
+    async def emojistats(self,
+                         ctx: discord.ApplicationContext,
+                         limit: Option(int, 'Number of emojis to show',
+                                       min_value=1,
+                                       max_value=50,
+                                       default=15,
+                                       required=False)):
+        await ctx.interaction.response.defer()
+        if ctx.interaction.guild_id not in EMOJI_LOG_GUILDS:
+            await ctx.interaction.followup.send(embed=gen_embed(title='Emoji Stats',
+                                                                content='Emoji usage is not tracked on this server.'),
+                                                ephemeral=True)
+            return
+        # Write out anything still sitting in the counter so the totals are current
+        await emoji_counter.flush()
+        results = db.emoji.find({'guild': ctx.interaction.guild_id}).sort('count', -1).limit(limit)
+        results = await results.to_list(length=limit)
+        embed_content = ''
+        for rank, document in enumerate(results, start=1):
+            emoji = self.bot.get_emoji(document['id'])
+            display = str(emoji) if emoji else f":{document['name']}:"
+            embed_content += f"**{rank}.** {display} - {document['count']}\n"
+        await ctx.interaction.followup.send(embed=gen_embed(title='Emoji Stats',
+                                                            content=embed_content or 'No emojis used yet.'))
+
     async def time_autocomplete(self, ctx):
         return [timezone for timezone in TIMEZONE_DICT if timezone.startswith(ctx.value.upper())]
 
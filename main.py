@@ -1,12 +1,19 @@
 import os
 import sys
 import asyncio
+import bisect
 import re
 import json
 import time
+import types
+import random
+import hashlib
+import importlib.util
+import collections
 import gc
 import logging
 import colorlog
+import httpx
 import twitter
 
 import discord
@@ -133,6 +140,204 @@ mclient.get_io_loop = asyncio.get_running_loop
 db = mclient[databaseName]
 log.info(f'Database loaded.\n')
 
+
+class GuildSettingsCache:
+    """Keeps one copy of each servers document in memory so the message hot path never has to hit the database.
+    Every write to db.servers should go through this class so the cached copy is dropped and reloaded on next use.
+    Documents returned by get() are shared, do not mutate them in place.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._documents = {}
+
+    async def get(self, guild_id):
+        try:
+            return self._documents[guild_id]
+        except KeyError:
+            pass
+        document = await self.collection.find_one({"server_id": guild_id})
+        if document is not None:
+            self._documents[guild_id] = document
+        return document
+
+    def prime(self, document):
+        self._documents[document['server_id']] = document
+
+    def invalidate(self, guild_id=None):
+        if guild_id is None:
+            self._documents.clear()
+        else:
+            self._documents.pop(guild_id, None)
+
+    async def update_one(self, query, update, **kwargs):
+        result = await self.collection.update_one(query, update, **kwargs)
+        self.invalidate(query.get('server_id'))
+        return result
+
+    async def delete_one(self, query, **kwargs):
+        result = await self.collection.delete_one(query, **kwargs)
+        self.invalidate(query.get('server_id'))
+        return result
+
+
+guild_settings = GuildSettingsCache(db.servers)
+
+
+class MessageIdBuffer:
+    """Write-behind buffer for the chat feature's msgid corpus.
+    Records are collected in memory and written with one unordered insert_many once batch_size records are waiting
+    or every flush_interval seconds, whichever comes first. If the database falls behind and max_pending records pile
+    up, add() waits on the flush already in progress instead of letting the buffer grow. While the database is
+    unreachable the oldest records are shed instead, so message handlers never queue up behind a broken connection.
+    """
+
+    def __init__(self, collection, batch_size=500, flush_interval=30, max_pending=5000):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = asyncio.Lock()
+        self._flusher = None
+        self._flush_task = None
+        self._failing = False
+        self._dropped = 0
+
+    def start(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.error(f"msgid flush loop error: {e}")
+
+    def _start_flush(self):
+        # Every caller shares one flush attempt rather than lining up on the lock for a retry each
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self.flush())
+        return self._flush_task
+
+    def _shed(self):
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            if not self._dropped or self._dropped // 1000 != (self._dropped + overflow) // 1000:
+                log.error(f"msgid buffer full while the database is unreachable, "
+                          f"{self._dropped + overflow} records dropped so far")
+            self._dropped += overflow
+
+    async def add(self, server_id, channel_id, msg_id):
+        self._pending.append({'server_id': server_id,
+                              'channel_id': channel_id,
+                              'msg_id': msg_id,
+                              'rand': random.random()})
+        if len(self._pending) >= self.max_pending:
+            if self._failing:
+                self._shed()
+            else:
+                await asyncio.shield(self._start_flush())
+        elif len(self._pending) >= self.batch_size and not self._lock.locked():
+            self._start_flush()
+
+    async def flush(self):
+        async with self._lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                try:
+                    await self.collection.insert_many(batch, ordered=False)
+                except pymongo.errors.BulkWriteError as e:
+                    log.warning(f"msgid flush: {len(e.details['writeErrors'])} of {len(batch)} records rejected")
+                except pymongo.errors.PyMongoError as e:
+                    # Put the batch back so it goes out with the next flush, dropping the oldest records only if
+                    # the database has been unreachable long enough to fill the buffer twice over.
+                    self._failing = True
+                    self._pending[:0] = batch
+                    overflow = len(self._pending) - self.max_pending * 2
+                    if overflow > 0:
+                        del self._pending[:overflow]
+                        log.error(f"msgid buffer full, dropped {overflow} records")
+                    log.error(f"msgid flush failed, {len(self._pending)} records pending: {e}")
+                    return
+                self._failing = False
+                self._dropped = 0
+
+    async def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+        await self.flush()
+
+
+msgid_buffer = MessageIdBuffer(db.msgid)
+
+CUSTOM_EMOJI_RE = re.compile(r'<a?:\w+:(\d+)>')
+EMOJI_LOG_GUILDS = {432379300684103699}
+
+
+class EmojiCounter:
+    """Counts custom emoji usage in memory and writes the totals to db.emoji every flush_interval seconds as one
+    bulk_write of $inc upserts. Nothing is read back before writing, so concurrent messages can't lose counts.
+    Only emojis that belong to the guild the message was sent in are counted.
+    """
+
+    def __init__(self, collection, flush_interval=60):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self._counts = collections.Counter()
+        self._emojis = {}
+        self._lock = asyncio.Lock()
+        self._flusher = None
+
+    def start(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def add(self, message):
+        for emoji_id in CUSTOM_EMOJI_RE.findall(message.content):
+            emoji = bot.get_emoji(int(emoji_id))
+            if emoji is not None and emoji.guild_id == message.guild.id:
+                self._counts[emoji.id] += 1
+                self._emojis[emoji.id] = emoji
+
+    async def flush(self):
+        async with self._lock:
+            if not self._counts:
+                return
+            counts, self._counts = self._counts, collections.Counter()
+            emojis, self._emojis = self._emojis, {}
+            updates = [pymongo.UpdateOne({'id': emoji_id},
+                                         {'$inc': {'count': count},
+                                          '$set': {'name': emojis[emoji_id].name,
+                                                   'guild': emojis[emoji_id].guild_id,
+                                                   'server_id': emojis[emoji_id].guild_id}},
+                                         upsert=True)
+                       for emoji_id, count in counts.items()]
+            try:
+                await self.collection.bulk_write(updates, ordered=False)
+            except pymongo.errors.PyMongoError as e:
+                # Merge the counts back in so they go out with the next flush
+                self._counts.update(counts)
+                self._emojis = {**emojis, **self._emojis}
+                log.error(f"emoji flush failed, {len(self._counts)} emojis pending: {e}")
+
+    async def close(self):
+        if self._flusher:
+            self._flusher.cancel()
+        await self.flush()
+
+
+emoji_counter = EmojiCounter(db.emoji)
+
 # twitter API load
 t = twitter.Twitter(
     auth=twitter.OAuth(TWTTOKEN, TWTSECRET, CONSUMER_KEY, CONSUMER_SECRET)
@@ -140,11 +345,254 @@ t = twitter.Twitter(
 log.info('Twitter API Initialized.\n')
 
 
+class TweetResolver:
+    """Looks up tweet metadata in a worker thread so the synchronous twitter client never blocks the event loop.
+    Results are cached per tweet id for ttl seconds and concurrent lookups of the same tweet share one request.
+    """
+
+    def __init__(self, client, ttl=3600, max_entries=2048):
+        self.client = client
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache = collections.OrderedDict()
+        self._inflight = {}
+
+    def _evict(self, now):
+        # Every entry gets the same ttl, so insertion order is also expiry order
+        while self._cache:
+            twid, (expires, _) = next(iter(self._cache.items()))
+            if expires > now and len(self._cache) <= self.max_entries:
+                break
+            del self._cache[twid]
+
+    async def get(self, twid):
+        now = time.monotonic()
+        entry = self._cache.get(twid)
+        if entry and entry[0] > now:
+            return entry[1]
+        if twid not in self._inflight:
+            self._inflight[twid] = asyncio.ensure_future(
+                asyncio.to_thread(self.client.statuses.show, _id=twid, tweet_mode="extended"))
+        task = self._inflight[twid]
+        try:
+            tweet = await asyncio.shield(task)
+        finally:
+            if task.done():
+                self._inflight.pop(twid, None)
+        self._cache.pop(twid, None)
+        self._cache[twid] = (time.monotonic() + self.ttl, tweet)
+        self._evict(now)
+        return tweet
+
+    async def get_many(self, twids):
+        return await asyncio.gather(*[self.get(twid) for twid in twids], return_exceptions=True)
+
+
+tweet_resolver = TweetResolver(t)
+
+# httpx only needs h2 to be installed for http2=True
+BESTDORI_HTTP2 = importlib.util.find_spec('h2') is not None
+
+try:
+    # orjson raises its own JSONDecodeError, which subclasses json.JSONDecodeError
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+
+class BestdoriClient:
+    """The one pooled HTTP client every cog uses to talk to Bestdori. Concurrent GETs of the same url share one request.
+    get_json caches the decoded body for a ttl that depends on the endpoint, so multi-megabyte catalogs are parsed once
+    per ttl. get is for images and other raw downloads and is never cached.
+    """
+
+    # First matching url fragment wins, a ttl of 0 means never cache (live tracker and leaderboard data)
+    TTLS = (
+        ('/api/tracker/data', 0),
+        ('/api/eventtop/', 0),
+        ('/api/sync/', 0),
+        ('/api/player/', 0),
+        ('/api/tracker/rates.json', 3600),
+        ('/api/events/', 600),
+        ('/api/', 3600),
+    )
+
+    def __init__(self, default_ttl=300, max_entries=512):
+        self.client = httpx.AsyncClient(
+            follow_redirects=True,
+            http2=BESTDORI_HTTP2,
+            timeout=httpx.Timeout(30.0, connect=10.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60))
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._cache = collections.OrderedDict()
+        self._inflight = {}
+        self.stats = collections.Counter()
+
+    def ttl(self, url):
+        for fragment, ttl in self.TTLS:
+            if fragment in url:
+                return ttl
+        return self.default_ttl
+
+    def _evict(self, now):
+        while self._cache:
+            key, (expires, _) = next(iter(self._cache.items()))
+            if expires > now and len(self._cache) <= self.max_entries:
+                break
+            del self._cache[key]
+
+    def _store(self, key, ttl, value):
+        self._cache.pop(key, None)
+        self._cache[key] = (time.monotonic() + ttl, value)
+        self._evict(time.monotonic())
+
+    async def _share(self, key, fetch):
+        if key in self._inflight:
+            self.stats['coalesced'] += 1
+        else:
+            task = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self._inflight[key] = task
+        # Shielded so one caller timing out doesn't cancel the request for everyone else waiting on it
+        return await asyncio.shield(self._inflight[key])
+
+    async def _fetch(self, url):
+        self.stats['requests'] += 1
+        return await self.client.get(url)
+
+    async def _fetch_json(self, url):
+        response = await self._fetch(url)
+        data = json_loads(response.content)
+        ttl = self.ttl(url)
+        if ttl and response.status_code == 200:
+            # Only the decoded body is kept, shared by every caller until it expires, so it's handed out read-only
+            if isinstance(data, dict):
+                data = types.MappingProxyType(data)
+            self._store(url, ttl, data)
+        return data
+
+    async def get(self, url):
+        return await self._share(('raw', url), lambda: self._fetch(url))
+
+    async def get_json(self, url, fresh=False):
+        """Decoded body of url. Raises json.JSONDecodeError if the body isn't JSON.
+        fresh skips the cache (still sharing a request already in flight) and replaces the cached copy.
+        """
+        entry = None if fresh else self._cache.get(url)
+        if entry and entry[0] > time.monotonic():
+            self.stats['hits'] += 1
+            return entry[1]
+        return await self._share(('json', url), lambda: self._fetch_json(url))
+
+    async def close(self):
+        await self.client.aclose()
+
+
+bestdori = BestdoriClient()
+
+TimelineEvent = collections.namedtuple('TimelineEvent', 'event_id name start end')
+
+
+class EventTimeline:
+    """Per-server index of Bestdori's event catalog, sorted by start time so finding the current, next or previous
+    event is a bisect instead of a scan over every event. Rebuilt in the background each time the catalog refreshes.
+    """
+
+    URL = 'https://bestdori.com/api/events/all.5.json'
+    SERVERS = 5
+
+    def __init__(self, client, interval=600):
+        self.client = client
+        self.interval = interval
+        self._servers = None
+        self._refresher = None
+
+    def build(self, api):
+        servers = []
+        for server in range(self.SERVERS):
+            events = []
+            for event_id, event in api.items():
+                start, end = event['startAt'][server], event['endAt'][server]
+                if start and end:
+                    events.append(TimelineEvent(event_id, event['eventName'][server], float(start), float(end)))
+            events.sort(key=lambda e: e.start)
+            servers.append(([e.start for e in events], events))
+        self._servers = servers
+
+    async def refresh(self):
+        # build() only swaps the index in once it has parsed the whole catalog, so a bad response keeps the old one
+        # Bypass the client cache, its ttl for the catalog matches our interval and would hand back the old copy
+        self.build(await self.client.get_json(self.URL, fresh=True))
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                log.error(f'event timeline refresh failed: {e}')
+
+    def start(self):
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._refresher:
+            self._refresher.cancel()
+
+    async def wait_ready(self):
+        """Only touches the network if the timeline has never been built."""
+        if self._servers is None:
+            try:
+                await self.refresh()
+            except Exception as e:
+                log.error(f'event timeline refresh failed: {e}')
+        return self._servers is not None
+
+    def _events(self, server):
+        return self._servers[server] if self._servers else ([], [])
+
+    def current(self, server, now=None):
+        now = time.time() * 1000 if now is None else now
+        starts, events = self._events(server)
+        i = bisect.bisect_left(starts, now)
+        if i and now < events[i - 1].end:
+            return events[i - 1]
+        return None
+
+    def next(self, server, now=None):
+        now = time.time() * 1000 if now is None else now
+        starts, events = self._events(server)
+        i = bisect.bisect_right(starts, now)
+        return events[i] if i < len(events) else None
+
+    def previous(self, server, now=None):
+        """The most recent event that has already ended."""
+        now = time.time() * 1000 if now is None else now
+        starts, events = self._events(server)
+        i = bisect.bisect_left(starts, now)
+        if i and now < events[i - 1].end:
+            i -= 1
+        return events[i - 1] if i else None
+
+    def nearest(self, server, now=None):
+        """The event whose start is closest to now, whether it has started yet or not."""
+        now = time.time() * 1000 if now is None else now
+        starts, events = self._events(server)
+        i = bisect.bisect_left(starts, now)
+        candidates = events[max(i - 1, 0):i + 1]
+        return min(candidates, key=lambda e: abs(now - e.start)) if candidates else None
+
+
+event_timeline = EventTimeline(bestdori)
+
+
 ##########
 
 
-async def initialize_document(guild, id):
-    post = {'server_id': id,
+def default_document(guild, id):
+    return {'server_id': id,
             'name': guild.name,
             'modrole': None,
             'autorole': None,
@@ -167,44 +615,143 @@ async def initialize_document(guild, id):
             'verify': [],
             'announcements': True
             }
+
+
+async def initialize_document(guild, id):
+    post = default_document(guild, id)
     log.info(f"Creating document for {guild.name}...")
     await db.servers.insert_one(post)
+    guild_settings.invalidate(id)
 
 
 async def check_document(guild, id):
     log.info("Checking db document for {}".format(guild.name))
-    if await db.servers.find_one({"server_id": id}) is None:
+    if await guild_settings.get(id) is None:
         log.info("Did not find one, creating document...")
         await initialize_document(guild, id)
-    else:
-        pass
-        # Changeable to update old documents whenever a new feature/config is added
-        #document = await db.servers.find_one({"server_id": id})
-        #try:
-        #    if document['log_messages']:
-        #        pass
-        #except KeyError:
-        #    post = {'log_messages': [False, None]}
-        #    await db.servers.update_one({"server_id": id},
-        #                                {"$set": post})
-
-        #try:
-        #    if type(document['log_messages'][0]) is list:
-        #        post = {'log_messages': document['log_messages'][0],
-        #                'log_joinleaves': document['log_joinleaves'][0],
-        #                'log_kbm': document['log_kbm'][0],
-        #                'log_strikes': document['log_strikes'][0]}
-        #        await db.servers.update_one({"server_id": id},
-        #                                   {"$set": post})
-
-        #except KeyError:
-        #    post = {'log_channel': None,
-        #            'log_messages': [False, None],
-        #            'log_joinleaves': [False, None],
-        #            'log_kbm': [False, None],
-        #            'log_strikes': [False, None]}
-        #    await db.servers.update_one({"server_id": id},
-        #                                {"$set": post})
+
+
+INDEXES = (
+    (db.msgid, [('server_id', pymongo.ASCENDING), ('rand', pymongo.ASCENDING)], {}),
+    (db.msgid, 'msg_id', {}),
+    (db.warns, [('server_id', pymongo.ASCENDING), ('user_id', pymongo.ASCENDING), ('time', pymongo.DESCENDING)], {}),
+    (db.reminders, 'future_time', {}),
+    (db.reminders, 'query_id', {}),
+    (db.reminders, [('user_id', pymongo.ASCENDING), ('query_id', pymongo.ASCENDING)],
+     {'unique': True, 'partialFilterExpression': {'query_id': {'$type': 'number'}}}),
+)
+MIGRATION_BATCH_SIZE = 1000
+
+
+async def backfill_msgid_rand():
+    """One-off migration giving entries recorded before random keys existed a rand value.
+    Walks the collection in _id order a batch at a time and records completion in db.botconfig so it never reruns.
+    """
+    if await db.botconfig.find_one({'name': 'msgid_rand_backfill', 'done': True}):
+        return
+    last_id = None
+    updated = 0
+    while True:
+        query = {'rand': {'$exists': False}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = await db.msgid.find(query, {'_id': 1}).sort('_id', pymongo.ASCENDING) \
+            .limit(MIGRATION_BATCH_SIZE).to_list(length=None)
+        if not batch:
+            break
+        ids = [entry['_id'] for entry in batch]
+        result = await db.msgid.update_many({'_id': {'$in': ids}}, [{'$set': {'rand': {'$rand': {}}}}])
+        updated += result.modified_count
+        last_id = ids[-1]
+        await asyncio.sleep(0)
+    await db.botconfig.update_one({'name': 'msgid_rand_backfill'}, {'$set': {'done': True}}, upsert=True)
+    log.info(f'msgid rand backfill complete, {updated} entries updated')
+
+
+async def ensure_indexes():
+    # Runs in the background after the first ready, a failure here is logged and must not hold up startup
+    for collection, keys, options in INDEXES:
+        try:
+            await collection.create_index(keys, **options)
+        except pymongo.errors.PyMongoError as e:
+            log.error(f'Could not create index {keys} on {collection.name}: {e}')
+    try:
+        await backfill_msgid_rand()
+    except pymongo.errors.PyMongoError as e:
+        log.error(f'msgid rand backfill failed, will retry next start: {e}')
+
+
+BOOTSTRAP_BATCH_SIZE = 1000
+
+
+async def bootstrap_documents(guilds):
+    """Bulk version of check_document for every guild the bot is in.
+    Loads existing documents with one $in query per batch, creates the missing ones with insert_many and backfills
+    any config field added since a document was created. Loaded documents are used to warm the settings cache.
+    """
+    created = 0
+    migrated = 0
+    for i in range(0, len(guilds), BOOTSTRAP_BATCH_SIZE):
+        batch = {guild.id: guild for guild in guilds[i:i + BOOTSTRAP_BATCH_SIZE]}
+        documents = await db.servers.find({'server_id': {'$in': list(batch)}}).to_list(length=None)
+
+        # Changeable to update old documents whenever a new feature/config is added, just add it to default_document
+        patches = []
+        for document in documents:
+            defaults = default_document(batch[document['server_id']], document['server_id'])
+            post = {key: value for key, value in defaults.items() if key not in document}
+            if post:
+                patches.append(pymongo.UpdateOne({'server_id': document['server_id']}, {'$set': post}))
+                document.update(post)
+        if patches:
+            await db.servers.bulk_write(patches, ordered=False)
+            migrated += len(patches)
+
+        found = {document['server_id'] for document in documents}
+        missing = [default_document(guild, guild_id) for guild_id, guild in batch.items() if guild_id not in found]
+        if missing:
+            await db.servers.insert_many(missing, ordered=False)
+            created += len(missing)
+
+        for document in documents + missing:
+            guild_settings.prime(document)
+    log.info(f"Checked {len(guilds)} guild documents, created {created}, migrated {migrated}")
+
+
+def _read_asset(path):
+    with open(path, 'rb') as asset_file:
+        data = asset_file.read()
+    return data, hashlib.sha256(data).hexdigest()
+
+
+async def sync_profile_assets():
+    """Uploads avatar.gif and banner.gif to the bot profile, but only the ones whose content changed since the last
+    upload. Files are read and hashed in a worker thread and the last uploaded hashes are kept in db.botconfig.
+    """
+    try:
+        (avatar, avatar_hash), (banner, banner_hash) = await asyncio.gather(asyncio.to_thread(_read_asset, 'avatar.gif'),
+                                                                            asyncio.to_thread(_read_asset, 'banner.gif'))
+    except OSError as e:
+        log.warning(f"Could not read profile assets: {e}")
+        return
+    document = await db.botconfig.find_one({'name': 'profile_assets'}) or {}
+    edits = {}
+    if document.get('avatar') != avatar_hash:
+        edits['avatar'] = avatar
+    if document.get('banner') != banner_hash:
+        edits['banner'] = banner
+    if not edits:
+        return
+    try:
+        await bot.user.edit(**edits)
+    except discord.HTTPException as e:
+        log.warning(f"Could not update profile assets: {e}")
+        return
+    log.info(f"Updated profile {', '.join(edits)}")
+    await db.botconfig.update_one({'name': 'profile_assets'},
+                                  {"$set": {'avatar': avatar_hash, 'banner': banner_hash}},
+                                  upsert=True)
+
 
 ##########
 
@@ -212,7 +759,7 @@ async def check_document(guild, id):
 async def get_prefix(bot, message):
     if isinstance(message.channel, discord.DMChannel):
         return default_prefix
-    server_prefix = (await db.servers.find_one({"server_id": message.guild.id}))['prefix']
+    server_prefix = (await guild_settings.get(message.guild.id))['prefix']
     return server_prefix or default_prefix
 
 
@@ -244,6 +791,15 @@ class EpsilonBot(bridge.AutoShardedBot):
         self.message_count = 0
         self.ready = False
         self.uptime = time.time()
+        self.route_counts = collections.Counter()
+        self.index_task = None
+
+    async def close(self):
+        await msgid_buffer.close()
+        await emoji_counter.close()
+        await event_timeline.close()
+        await bestdori.close()
+        await super().close()
 
 
 bot = EpsilonBot(command_prefix=get_prefix, intents=intents, case_insensitive=True)
@@ -271,9 +827,13 @@ bot.load_extension("commands.custom")
 
 @bot.event
 async def on_ready():
-    for guild in bot.guilds:
-        await check_document(guild, guild.id)
+    await bootstrap_documents(bot.guilds)
     gc.collect()
+    msgid_buffer.start()
+    emoji_counter.start()
+    event_timeline.start()
+    if not bot.ready:
+        bot.index_task = asyncio.create_task(ensure_indexes())
     bot.ready = True
 
     log.info("\n### PRE-STARTUP CHECKS PASSED ###\n")
@@ -282,11 +842,7 @@ async def on_ready():
 
     status = discord.Game(f'/help | {len(bot.guilds)} servers')
     await bot.change_presence(activity=status)
-    banner_file = open('banner.gif', 'rb')
-    banner = banner_file.read()
-    avatar_file = open('avatar.gif', 'rb')
-    avatar = avatar_file.read()
-    await bot.user.edit(avatar=avatar, banner=banner)
+    await sync_profile_assets()
 
     log.info(f"Connected: {bot.user.id}/{bot.user.name}#{bot.user.discriminator}")
     owner = await bot.application_info()
@@ -300,171 +856,303 @@ async def on_ready():
     print(flush=True)
 
 
+class ReferenceResolver:
+    """Finds the message a reply points to, trying message.reference.resolved, then the client message cache, then a
+    bounded LRU of ids of messages the bot sent, and only fetching from the API when all of those miss. Replies to a
+    deleted message never reach the API. Where each lookup was answered is counted in stats.
+    """
+
+    def __init__(self, max_ids=10000):
+        self.max_ids = max_ids
+        self.stats = collections.Counter()
+        self._bot_ids = collections.OrderedDict()
+
+    def remember(self, message_id):
+        self._bot_ids[message_id] = None
+        self._bot_ids.move_to_end(message_id)
+        if len(self._bot_ids) > self.max_ids:
+            self._bot_ids.popitem(last=False)
+
+    def _deleted(self, reference):
+        if isinstance(reference.resolved, discord.DeletedReferencedMessage):
+            self.stats['deleted'] += 1
+            return True
+        return False
+
+    def _local(self, reference):
+        if isinstance(reference.resolved, discord.Message):
+            self.stats['resolved'] += 1
+            return reference.resolved
+        cached = bot.get_message(reference.message_id)
+        if cached:
+            self.stats['cache'] += 1
+        return cached
+
+    async def _fetch(self, message):
+        self.stats['fetch'] += 1
+        try:
+            ref_message = await message.channel.fetch_message(message.reference.message_id)
+        except discord.NotFound:
+            return None
+        if ref_message.author.id == bot.user.id:
+            self.remember(ref_message.id)
+        return ref_message
+
+    async def resolve(self, message):
+        """The referenced message, or None if it was deleted."""
+        if self._deleted(message.reference):
+            return None
+        return self._local(message.reference) or await self._fetch(message)
+
+    async def is_bot_message(self, message):
+        if self._deleted(message.reference):
+            return False
+        ref_message = self._local(message.reference)
+        if ref_message:
+            return ref_message.author.id == bot.user.id
+        if message.reference.message_id in self._bot_ids:
+            self.stats['lru'] += 1
+            self._bot_ids.move_to_end(message.reference.message_id)
+            return True
+        ref_message = await self._fetch(message)
+        return ref_message is not None and ref_message.author.id == bot.user.id
+
+
+reference_resolver = ReferenceResolver()
+
+
+async def classify_message(message):
+    """Cheap routing decision for on_message, made from the cached guild settings and raw mention ids before any
+    context object is built. Returns 'command', 'reply', 'mention', 'ingest', 'dm' or 'ignore'.
+    """
+    if message.author.bot:
+        return 'ignore'
+    if isinstance(message.channel, discord.DMChannel):
+        if message.reference or message.content.startswith(default_prefix):
+            return 'dm'
+        return 'ignore'
+    if not (isinstance(message.channel, discord.TextChannel) or isinstance(message.channel, discord.Thread)):
+        return 'ignore'
+    document = await guild_settings.get(message.guild.id)
+    prefix = document['prefix'] or default_prefix
+    if message.content.startswith(prefix):
+        # bypass check for now for t100 chart hub, keep prefix check first though
+        if not (message.guild.id == 616088522100703241 and message.reference):
+            return 'command'
+    # check if message has a reference & is a reply
+    if message.reference and message.reference.message_id and message.type != discord.MessageType.pins_add:
+        return 'reply'
+    if bot.user.id in message.raw_mentions:
+        return 'mention'
+    return 'ingest'
+
+
 @bot.event
 async def on_message(message):
     bot.message_count += 1
-    ctx = await bot.get_context(message)
-
-    if isinstance(ctx.channel, discord.TextChannel) or isinstance(ctx.channel, discord.Thread):
-
-        if ctx.guild.id == 432379300684103699:
-            await _emoji_log(message)
-
-        if ctx.author.bot is False:
-            if ctx.prefix:
-                # bypass check for now for t100 chart hub, keep prefix check first though
-                if ctx.guild.id == 616088522100703241 and ctx.message.reference:
-                    pass
-                else:
-                    # whitelist check
-                    document = await db.servers.find_one({"server_id": ctx.guild.id})
-                    try:
-                        whitelist = document['whitelist']
-                    except KeyError:
-                        whitelist = None
-                    if whitelist and ctx.channel.id not in whitelist:
-                        return
-                    log.info(
-                        f"{ctx.message.author.id}/{ctx.message.author.name}{ctx.message.author.discriminator}: {ctx.message.content}")
-                    await bot.invoke(ctx)
-                    bot.command_count += 1
-                    return
 
-            # check if message has a reference & is a reply
-            if ctx.message.reference and ctx.message.type != discord.MessageType.pins_add:
-                if ctx.message.reference.message_id:
-                    ref_message = await ctx.message.channel.fetch_message(ctx.message.reference.message_id)
-
-                    if ref_message.author == bot.user:
-                        document = await db.servers.find_one({"server_id": ctx.guild.id})
-                        if document['modmail_channel'] and ctx.channel.id == document['modmail_channel']:
-                            await modmail_response_guild(message, ctx, ref_message)
-                            return
-                        elif document['chat']:
-                            try:
-                                whitelist = document['whitelist']
-                            except KeyError:
-                                whitelist = None
-                            if whitelist and ctx.channel not in whitelist:
-                                return
-                            log.info("Found a reply to me, generating response...")
-                            try:
-                                blacklist = document['blacklist']
-                            except TypeError:
-                                blacklist = None
-                            log.info("Obtained blacklist")
-                            msg = await get_msgid(ctx.message, blacklist=blacklist)
-                            await ctx.message.reply(content=msg)
-                            return
-
-            if bot.user.id in ctx.message.raw_mentions and ctx.author != bot.user:
-                document = await db.servers.find_one({"server_id": ctx.guild.id})
-                if document['chat']:
-                    try:
-                        whitelist = document['whitelist']
-                    except TypeError:
-                        whitelist = None
-                    if whitelist and ctx.channel not in whitelist:
-                        return
-                    log.info("Found a reply to me, generating response...")
-                    try:
-                        blacklist = document['blacklist']
-                    except TypeError:
-                        blacklist = None
-                    log.info("Obtained blacklist")
-                    msg = await get_msgid(ctx.message, blacklist=blacklist)
-                    await ctx.message.reply(content=msg)
-                    return
-
-            document = await db.servers.find_one({"server_id": ctx.guild.id})
-            try:
-                blacklist = document['blacklist']
-            except TypeError:
-                blacklist = None
-            if document['blacklist']:
-                if ctx.channel.id not in document['blacklist']:
-                    post = {'server_id': ctx.guild.id,
-                            'channel_id': ctx.channel.id,
-                            'msg_id': ctx.message.id}
-                    await db.msgid.insert_one(post)
-            else:
-                post = {'server_id': ctx.guild.id,
-                        'channel_id': ctx.channel.id,
-                        'msg_id': ctx.message.id}
-                await db.msgid.insert_one(post)
-            del document
-
-    elif isinstance(ctx.channel, discord.DMChannel):
-        if ctx.author.bot is False:
-            if ctx.message.reference:
-                ref_message = await ctx.message.channel.fetch_message(ctx.message.reference.message_id)
+    if isinstance(message.channel, discord.TextChannel) or isinstance(message.channel, discord.Thread):
+        if message.guild.id in EMOJI_LOG_GUILDS:
+            emoji_counter.add(message)
+
+    if message.author.id == bot.user.id:
+        reference_resolver.remember(message.id)
+
+    route = await classify_message(message)
+    if route == 'command':
+        # whitelist check
+        document = await guild_settings.get(message.guild.id)
+        whitelist = document.get('whitelist')
+        if whitelist and message.channel.id not in whitelist:
+            route = 'ignore'
+        else:
+            ctx = await bot.get_context(message)
+            log.info(f"{message.author.id}/{message.author.name}{message.author.discriminator}: {message.content}")
+            await bot.invoke(ctx)
+            bot.command_count += 1
+
+    elif route == 'dm':
+        ctx = await bot.get_context(message)
+        if message.reference:
+            ref_message = await reference_resolver.resolve(message)
+            if ref_message:
                 await modmail_response_dm(message, ctx, ref_message)
-            elif ctx.prefix:
-                if ctx.command.name == 'modmail':
-                    await bot.invoke(ctx)
+        elif ctx.command and ctx.command.name == 'modmail':
+            await bot.invoke(ctx)
+
+    elif route != 'ignore':
+        route = await _guild_message(message, route)
+
+    bot.route_counts[route] += 1
+
+
+async def _guild_message(message, route):
+    document = await guild_settings.get(message.guild.id)
+    if route == 'reply':
+        if document['modmail_channel'] and message.channel.id == document['modmail_channel']:
+            # modmail needs the referenced embed, not just its author
+            ref_message = await reference_resolver.resolve(message)
+            if ref_message and ref_message.author.id == bot.user.id:
+                ctx = await bot.get_context(message)
+                await modmail_response_guild(message, ctx, ref_message)
+                return 'reply'
+        elif document['chat'] and await reference_resolver.is_bot_message(message):
+            await _chat_response(message, document)
+            return 'reply'
+        route = 'mention' if bot.user.id in message.raw_mentions else 'ingest'
+
+    if route == 'mention' and document['chat']:
+        await _chat_response(message, document)
+        return 'mention'
+
+    blacklist = document.get('blacklist')
+    if not blacklist or message.channel.id not in blacklist:
+        await msgid_buffer.add(message.guild.id, message.channel.id, message.id)
+    return 'ingest'
+
+
+async def _chat_response(message, document):
+    whitelist = document.get('whitelist')
+    if whitelist and message.channel.id not in whitelist:
+        return
+    log.info("Found a reply to me, generating response...")
+    msg = await get_msgid(message, blacklist=document.get('blacklist'))
+    if msg:
+        await message.reply(content=msg)
 
 
 ##########
 
 
-# This recursive function checks the database for a message ID for the bot to fetch a message and respond with when
-# mentioned or replied to.
-async def get_msgid(message, attempts=1, blacklist=None):
-    # Construct the aggregation pipeline, match for the current server id and exclude bot messages if they somehow
-    # snuck past the initial regex.
-    pipeline = [{'$sample': {'size': 500}},
-                {'$match':
-                     {'$and': [{'server_id': message.guild.id},
-                               {'author_id': {'$not': {'$regex': str(bot.user.id)}}}]}},
-                {'$limit': 1}]
-    async for msgid in db.msgid.aggregate(pipeline):
-        # Searches each channel until it finds the channel the message was sent in.
-        # This lets us fetch the message.
-        for channel in message.guild.channels:
-            if channel.id == msgid['channel_id']:
-                try:
-                    # We fetch the message, as we do not store any message contents for user privacy. If the message
-                    # is deleted, we can't access it.
-                    msg = await channel.fetch_message(msgid['msg_id'])
-                    document = await db.servers.find_one({"server_id": msg.guild.id})
-                    if blacklist:
-                        log.info(f"blacklist detected")
-                        # log.info(msg.channel.id)
-                        if msg.channel.id in blacklist:
-                            attempts += 1
-                            mid = msgid['msg_id']
-                            await db.msgid.delete_one({"msg_id": mid})
-                            log.info("Channel blacklisted, removing entry from db...")
-                            return await get_msgid(message, attempts, blacklist)
-                    # Now let's doublecheck that we aren't mentioning ourselves or another bot, and that the messages
-                    # has no embeds or attachments.
-                    filter = f"(?:{'|'.join(FILTER)})"
-                    if (re.match(r'^%|^\^|^\$|^!|^\.|@|k!', msg.content) is None) and (
-                            re.match(f'<@!?{bot.user.id}>', msg.content) is None) and (len(msg.embeds) == 0) and (
-                            msg.author.bot is False) and (re.match(filter, msg.content) is None):
-                        log.info("Attempts taken:{}".format(attempts))
-                        log.info("Message ID:{}".format(msg.id))
-                        return msg.clean_content
-                    else:
-                        # If we fail, remove that message ID from the DB so we never call it again.
-                        attempts += 1
-                        mid = msgid['msg_id']
-                        await db.msgid.delete_one({"msg_id": mid})
-                        log.info("Removing entry from db...")
-                        return await get_msgid(message, attempts)
-
-                except discord.Forbidden:
-                    raise discord.ext.commands.CommandError("I don't have permissions to read message history.")
-
-                except discord.NotFound:
-                    # This happens sometimes due to deleted message or other weird shenanigans, so do the same as above.
-                    attempts += 1
-                    mid = msgid['msg_id']
-                    await db.msgid.delete_one({"msg_id": mid})
-                    log.info("Removing entry from db...")
-                    return await get_msgid(message, attempts)
-    attempts += 1
-    return await get_msgid(message, attempts)
+# Chat feature message picker. Every stored msgid carries a random key ('rand'), so a random slice of one guild's
+# corpus can be read straight off the (server_id, rand) index instead of sampling the whole collection.
+CHAT_BATCH_SIZE = 5
+CHAT_MAX_ROUNDS = 3
+
+
+async def _sample_msgids(guild_id, size):
+    pivot = random.random()
+    candidates = await db.msgid.find({'server_id': guild_id, 'rand': {'$gte': pivot}}) \
+        .sort('rand', pymongo.ASCENDING).limit(size).to_list(length=size)
+    if len(candidates) < size:
+        # Wrap around to the start of the key range
+        remaining = size - len(candidates)
+        candidates += await db.msgid.find({'server_id': guild_id, 'rand': {'$lt': pivot}}) \
+            .sort('rand', pymongo.ASCENDING).limit(remaining).to_list(length=remaining)
+    return candidates
+
+
+class ChatFilter:
+    """Validates chat feature candidates against one compiled pattern instead of a regex per rule.
+    The pattern combines the command prefix check, the self mention check and every FILTER rule as named groups, so a
+    single match both rejects the message and tells us which rule did it. It is only rebuilt when FILTER or the bot
+    user changes. Rejections are counted per rule in stats.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.stats = collections.Counter()
+        self.checked = 0
+        self._source = None
+        self._bot_id = None
+        self._pattern = None
+        self._labels = {}
+
+    def _compile(self, bot_id):
+        labels = {'prefix': 'command prefix',
+                  'mention': 'self mention'}
+        groups = [r'(?P<prefix>%|\^|\$|!|\.|@|k!)',
+                  f'(?P<mention><@!?{bot_id}>)']
+        for i, rule in enumerate(self.rules):
+            labels[f'rule{i}'] = rule
+            groups.append(f'(?P<rule{i}>{rule})')
+        self._pattern = re.compile('|'.join(groups))
+        self._labels = labels
+        self._source = list(self.rules)
+        self._bot_id = bot_id
+
+    def reject_reason(self, msg, blacklist=None):
+        if blacklist and msg.channel.id in blacklist:
+            return 'blacklisted channel'
+        if msg.author.bot:
+            return 'bot author'
+        if len(msg.embeds) > 0:
+            return 'embed'
+        match = self._pattern.match(msg.content)
+        if match:
+            return self._labels[match.lastgroup]
+        return None
+
+    def check_batch(self, messages, blacklist=None):
+        """Returns a list of booleans, True for each message that can be used as a chat response."""
+        if self._pattern is None or self._bot_id != bot.user.id or self._source != self.rules:
+            self._compile(bot.user.id)
+        verdicts = []
+        for msg in messages:
+            reason = self.reject_reason(msg, blacklist)
+            if reason:
+                self.stats[reason] += 1
+            verdicts.append(reason is None)
+        self.checked += len(messages)
+        return verdicts
+
+
+chat_filter = ChatFilter(FILTER)
+
+
+async def _fetch_candidate(guild, entry):
+    channel = guild.get_channel_or_thread(entry['channel_id'])
+    if channel is None:
+        # Archived threads aren't in the cache, fetch_channel only raises NotFound if the channel is really gone
+        channel = await guild.fetch_channel(entry['channel_id'])
+    # We fetch the message, as we do not store any message contents for user privacy. If the message
+    # is deleted, we can't access it.
+    return await channel.fetch_message(entry['msg_id'])
+
+
+async def get_msgid(message, blacklist=None):
+    """Find a random stored message from the guild for the bot to respond with when mentioned or replied to.
+    Pulls CHAT_BATCH_SIZE candidates per round for at most CHAT_MAX_ROUNDS rounds, fetches each round concurrently and
+    removes every deleted or filtered candidate from the database in one delete_many. Returns None if nothing usable
+    was found.
+    """
+    forbidden = False
+    for attempt in range(1, CHAT_MAX_ROUNDS + 1):
+        candidates = await _sample_msgids(message.guild.id, CHAT_BATCH_SIZE)
+        if not candidates:
+            return None
+        results = await asyncio.gather(*[_fetch_candidate(message.guild, entry) for entry in candidates],
+                                       return_exceptions=True)
+        dead = []
+        fetched = []
+        for entry, result in zip(candidates, results):
+            if isinstance(result, discord.Forbidden):
+                forbidden = True
+            elif isinstance(result, discord.NotFound):
+                # The message or its channel was deleted
+                dead.append(entry['msg_id'])
+            elif isinstance(result, Exception):
+                # Rate limits, 5xx and timeouts say nothing about the entry itself, so leave it for next time
+                log.warning(f"Could not fetch stored message {entry['msg_id']}: {result}")
+            else:
+                fetched.append(result)
+        chosen = None
+        for msg, valid in zip(fetched, chat_filter.check_batch(fetched, blacklist)):
+            if not valid:
+                # If we fail, remove that message ID from the DB so we never call it again.
+                dead.append(msg.id)
+            elif chosen is None:
+                chosen = msg
+        if dead:
+            log.info(f"Removing {len(dead)} entries from db...")
+            await db.msgid.delete_many({'msg_id': {'$in': dead}})
+        if chosen:
+            log.info("Attempts taken:{}".format(attempt))
+            log.info("Message ID:{}".format(chosen.id))
+            return chosen.clean_content
+    if forbidden:
+        raise discord.ext.commands.CommandError("I don't have permissions to read message history.")
+    return None
 
 
 async def modmail_response_guild(message, ctx, ref_message):
@@ -520,7 +1208,7 @@ async def modmail_response_dm(message, ctx, ref_message):
         ref_embed = ref_message.embeds[0].footer
         guild_id = ref_embed.text
         try:
-            document = await db.servers.find_one({"server_id": int(guild_id)})
+            document = await guild_settings.get(int(guild_id))
         except ValueError:
             embed = gen_embed(title='Error',
                               content=f'Cannot find a valid server ID in the footer. Are you sure you replied to the right message?')
@@ -613,28 +1301,6 @@ async def modmail_attachment(ctx, channel, scenario: int = None):
                 return
 
 
-async def _emoji_log(message):
-    custom_emojis_raw = re.findall(r'<a?:\w*:\d*>', message.content)
-    custom_emojis_formatted = [int(e.split(':')[2].replace('>', '')) for e in custom_emojis_raw]
-    custom_emojis = []
-    for e in custom_emojis_formatted:
-        entry = discord.utils.get(message.guild.emojis, id=e)
-        if entry is not None:
-            custom_emojis.append(entry)
-    if len(custom_emojis) > 0:
-        for emoji in custom_emojis:
-            if await db.emoji.find_one({"id": emoji.id}) is None:
-                post = {'id': emoji.id,
-                        'name': emoji.name,
-                        'guild': emoji.guild_id,
-                        'count': 0
-                        }
-                await db.emoji.insert_one(post)
-            document = await db.emoji.find_one({"id": emoji.id})
-            count = document['count'] + 1
-            await db.emoji.update_one({"id": emoji.id}, {"$set": {'count': count}})
-
-
 async def twtfix(message):
     message_link = message.clean_content
     author = message.author
@@ -643,12 +1309,15 @@ async def twtfix(message):
 
     twitter_links = re.findall(r'https://twitter\.com\S+', message_link)
     if twitter_links:
-        document = await db.servers.find_one({"server_id": message.guild.id})
-        for twt_link in twitter_links:
-            log.info(f"[{message.guild.id}] Attempting to download tweet info from Twitter API")
-            twid = int(
-                re.sub(r'\?.*$', '', twt_link.rsplit("/", 1)[-1]))  # gets the tweet ID as a int from the passed url
-            tweet = t.statuses.show(_id=twid, tweet_mode="extended")
+        document = await guild_settings.get(message.guild.id)
+        log.info(f"[{message.guild.id}] Attempting to download tweet info from Twitter API")
+        # gets the tweet ID as a int from the passed url
+        twids = [int(re.sub(r'\?.*$', '', twt_link.rsplit("/", 1)[-1])) for twt_link in twitter_links]
+        tweets = await tweet_resolver.get_many(twids)
+        for twt_link, twid, tweet in zip(twitter_links, twids, tweets):
+            if isinstance(tweet, Exception):
+                log.warning(f"[{message.guild.id}] Could not get tweet {twid}: {tweet}")
+                continue
 
             # Check to see if tweet has a video, if not, make the url passed to the VNF the first t.co link in the tweet
             if 'extended_entities' in tweet: